@@ -0,0 +1,333 @@
+"""此目的在于对模拟、网络分析与可视化的各个环节做规模阶梯基准测试，保存基线并与基线比较以发现性能回退"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from profiling import _format_bytes, max_rss
+
+SIZES = (30, 100, 300, 1000, 3000, 10000)
+DAYS = (10, 30)
+METRICS = ('seconds', 'rss_bytes', 'traced_peak_bytes')
+
+
+def _students(model, num_students):
+    from ensemble import MODELS
+    from freshman import InitialFreshman
+
+    freshman_class = MODELS[model][0]
+    if freshman_class is InitialFreshman:
+        return freshman_class(num_students).get_students()
+    return freshman_class(num_students, seed=0).get_students()
+
+
+def _relationship_matrix(num_students, days):
+    from ensemble import simulate_replica
+
+    matrix = simulate_replica('base', num_students, days, np.random.SeedSequence(0))
+    return matrix if isinstance(matrix, np.ndarray) else matrix.toarray()
+
+
+def _adjacency(num_students, days):
+    from network import convert_to_adjacency_matrix
+
+    return convert_to_adjacency_matrix(_relationship_matrix(num_students, days))
+
+
+def _simulate(model, update_mode, **options):
+    def run(students, days):
+        from ensemble import MODELS
+
+        relationships = MODELS[model][1](students, update_mode=update_mode, seed=0, **options)
+        relationships.simulate_relationships(days=days)
+    return run
+
+
+def _chart(name, needs_students=False):
+    """
+    可视化函数的基准：每次重新构建 NetworkAnalysis 并使用新的布局缓存，
+    计时包含建图与布局，与一次真实运行的首次出图一致。
+    """
+    def run(adjacency, students, save_path):
+        import visualization
+        from layout import LayoutCache
+        from network import NetworkAnalysis
+
+        function = getattr(visualization, name)
+        analysis = NetworkAnalysis(adjacency, layout_cache=LayoutCache())
+        if needs_students:
+            function(analysis, students, save_path)
+        else:
+            function(analysis, save_path)
+    return run
+
+
+def _chart_setup(num_students, days, directory):
+    return _adjacency(num_students, days), _students('base', num_students), directory
+
+
+def _matrix_chart(name):
+    def run(matrix, save_path):
+        import visualization
+
+        getattr(visualization, name)(matrix, save_path)
+    return run
+
+
+def _calculate_centrality(backend):
+    def run(adjacency):
+        from network import calculate_centrality
+
+        calculate_centrality(adjacency, backend=backend)
+    return run
+
+
+def _convert(matrix, directory):
+    from network import convert_to_adjacency_matrix
+
+    convert_to_adjacency_matrix(matrix)
+
+
+def _population_setup(model):
+    return lambda num_students, days, directory: (_students(model, num_students), days)
+
+
+def _campus_setup(num_students, days, directory):
+    from campus import CampusFreshman
+
+    return CampusFreshman(num_classes=max(num_students // 30, 1), class_size=30, seed=0).get_students(), days
+
+
+def _simulate_campus(students, days):
+    from campus import CampusRelationship
+
+    CampusRelationship(students, seed=0).simulate_relationships(days=days)
+
+
+def _pressure_setup(num_students, days, directory):
+    return (_relationship_matrix(num_students, days).astype(np.float64),)
+
+
+def _pressure_step(engine):
+    """
+    结构压力一步的基准：比较编译的三重循环（kernels.pressure_step）与分块矩阵乘法，
+    engine='kernel' 只有在这里稳定快于 'matrix' 时才值得在 StructureRelationship 中选用。
+    """
+    def run(matrix):
+        if engine == 'kernel':
+            import kernels
+
+            kernels.pressure_step(matrix, 0.0015)
+        else:
+            from relationship import blocked_pressure_step
+
+            blocked_pressure_step(matrix, 0.0015)
+    return run
+
+
+def _matrix_setup(num_students, days, directory):
+    return _relationship_matrix(num_students, days), directory
+
+
+def _adjacency_setup(num_students, days, directory):
+    return (_adjacency(num_students, days),)
+
+
+# 基准名 -> (准备输入的函数 (人数, 天数, 临时目录) -> 参数元组, 被计时的函数, 最大人数)
+# 最大人数以外的规模默认跳过（如 networkx 介数中心性与 spring 布局在上万节点时不可行）
+CASES = {
+    'simulate_initial': (_population_setup('initial'), _simulate('initial', 'batch'), 10000),
+    'simulate_base': (_population_setup('base'), _simulate('base', 'batch'), 10000),
+    'simulate_structure': (_population_setup('structure'), _simulate('structure', 'batch'), 3000),
+    'simulate_structure_loop': (_population_setup('structure'), _simulate('structure', 'loop'), 300),
+    'simulate_structure_kernel': (_population_setup('structure'), _simulate('structure', 'kernel'), 3000),
+    'simulate_structure_event': (_population_setup('structure'), _simulate('structure', 'event', storage='sparse'),
+                                 10000),
+    'pressure_step_matrix': (_pressure_setup, _pressure_step('matrix'), 10000),
+    'pressure_step_kernel': (_pressure_setup, _pressure_step('kernel'), 3000),
+    'simulate_campus': (_campus_setup, _simulate_campus, 100000),
+    'convert_to_adjacency_matrix': (_matrix_setup, _convert, 10000),
+    'calculate_centrality': (_adjacency_setup, _calculate_centrality('networkx'), 1000),
+    'calculate_centrality_matrix': (_adjacency_setup, _calculate_centrality('matrix'), 3000),
+    'plot_heatmap': (_matrix_setup, _matrix_chart('plot_heatmap'), 3000),
+    'visualize_matrix_distribution': (_matrix_setup, _matrix_chart('visualize_matrix_distribution'), 3000),
+    'visualize_social_network': (_chart_setup, _chart('visualize_social_network'), 300),
+    'visualize_network_with_centrality': (_chart_setup, _chart('visualize_network_with_centrality'), 300),
+    'visualize_social_network_attribute': (_chart_setup, _chart('visualize_social_network_attribute', True), 300),
+}
+
+
+def case_key(name, num_students, days):
+    return f'{name}[n={num_students},days={days}]'
+
+
+def run_case(name, num_students, days, repeat=3, trace=True):
+    """
+    运行一个基准：准备输入并预热一次（导入延迟加载的模块，均不计时），重复计时 repeat 次，
+    再在 tracemalloc 下运行一次统计分配峰值。
+
+    :param name: CASES 中的基准名
+    :param num_students: 人数
+    :param days: 模拟天数（非模拟基准用于生成输入矩阵）
+    :param repeat: 计时次数
+    :param trace: 是否统计 tracemalloc 分配峰值（会拖慢运行，单独执行一次）
+    :return: 结果字典（seconds 为中位数，另含 min_seconds、rss_bytes、traced_peak_bytes）
+    """
+    os.environ.setdefault('SNS_HEADLESS', '1')
+    setup, function, _ = CASES[name]
+    times = []
+    traced_peak = None
+    with tempfile.TemporaryDirectory() as directory:  # 图片等输出写到临时目录
+        arguments = setup(num_students, days, directory)
+        function(*arguments)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(*arguments)
+            times.append(time.perf_counter() - start)
+        if trace:
+            tracemalloc.start()
+            function(*arguments)
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {'seconds': statistics.median(times), 'min_seconds': min(times), 'repeat': repeat,
+            'rss_bytes': max_rss(), 'traced_peak_bytes': traced_peak}
+
+
+def run_benchmarks(names=None, sizes=SIZES, days=DAYS, repeat=3, trace=True, isolate=True, limits=True,
+                   progress=print):
+    """
+    在人数 × 天数阶梯上运行所选基准。
+
+    :param names: 基准名列表，默认全部 CASES
+    :param sizes: 人数阶梯
+    :param days: 天数阶梯
+    :param repeat: 每个规模的计时次数
+    :param trace: 是否统计 tracemalloc 分配峰值
+    :param isolate: 每个基准在新的进程中运行（峰值 RSS 只反映该基准）；False 时在当前进程串行运行
+    :param limits: 是否跳过超过基准最大人数的规模
+    :param progress: 每完成一个基准调用一次的回调（参数为一行文本），None 表示不输出
+    :return: 基线字典 {'meta': ..., 'results': {基准键: 结果}}
+    """
+    names = list(names or CASES)
+    unknown = set(names) - set(CASES)
+    if unknown:
+        raise ValueError(f"未知的基准：{sorted(unknown)}，可选 {list(CASES)}")
+    results = {}
+    pool = ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) if isolate else None
+    try:
+        for name in names:
+            for num_students in sizes:
+                if limits and num_students > CASES[name][2]:
+                    continue
+                for day_count in days:
+                    if pool is None:
+                        result = run_case(name, num_students, day_count, repeat, trace)
+                    else:
+                        result = pool.submit(run_case, name, num_students, day_count, repeat, trace).result()
+                    key = case_key(name, num_students, day_count)
+                    results[key] = dict(result, name=name, num_students=num_students, days=day_count)
+                    if progress:
+                        progress(f'{key:<60}{result["seconds"]:>10.4f} s')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {'meta': environment(), 'results': results}
+
+
+def environment():
+    """
+    记录基线的运行环境，比较不同机器上的基线时用于提示。
+    """
+    return {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+            'numpy': np.__version__, 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+def save_baseline(baseline, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(baseline, file, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare(current, baseline, tolerance=0.2, min_seconds=0.005):
+    """
+    将本次结果与基线逐项比较。某项指标超过基线的 (1 + tolerance) 倍即视为回退；
+    耗时差小于 min_seconds 的项忽略计时噪声。
+
+    :param current: run_benchmarks 的返回值
+    :param baseline: 基线（同结构）
+    :param tolerance: 允许的相对增幅
+    :param min_seconds: 计时比较的最小绝对差
+    :return: [(基准键, 指标, 基线值, 本次值, 比值, 是否回退)]，只含两边都有的项
+    """
+    rows = []
+    for key, result in current['results'].items():
+        reference = baseline['results'].get(key)
+        if reference is None:
+            continue
+        for metric in METRICS:
+            old, new = reference.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            regressed = ratio > 1 + tolerance and not (metric == 'seconds' and new - old < min_seconds)
+            rows.append((key, metric, old, new, ratio, regressed))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f'{"基准":<60}{"指标":<20}{"基线":>12}{"本次":>12}{"比值":>8}']
+    for key, metric, old, new, ratio, regressed in rows:
+        show = (lambda value: f'{value:.4f}') if metric == 'seconds' else _format_bytes
+        lines.append(f'{key:<60}{metric:<20}{show(old):>12}{show(new):>12}{ratio:>8.2f}'
+                     + ('  <-- 回退' if regressed else ''))
+    return '\n'.join(lines)
+
+
+def _integers(text):
+    return tuple(int(item) for item in text.split(','))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='规模阶梯基准测试')
+    parser.add_argument('--cases', help=f'逗号分隔的基准名，默认全部：{",".join(CASES)}')
+    parser.add_argument('--sizes', type=_integers, default=SIZES, help='人数阶梯，如 30,100,1000')
+    parser.add_argument('--days', type=_integers, default=DAYS, help='天数阶梯，如 10,30')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-trace', dest='trace', action='store_false', help='不统计 tracemalloc 分配峰值')
+    parser.add_argument('--in-process', dest='isolate', action='store_false', help='不为每个基准启动新进程')
+    parser.add_argument('--no-limits', dest='limits', action='store_false', help='不跳过超过基准最大人数的规模')
+    parser.add_argument('--save', help='把结果保存为基线 JSON')
+    parser.add_argument('--compare', help='与该基线 JSON 比较，出现回退时以状态码 1 退出')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的相对增幅（默认 0.2）')
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.cases.split(',') if args.cases else None, args.sizes, args.days, args.repeat,
+                             args.trace, args.isolate, args.limits)
+    if args.save:
+        save_baseline(current, args.save)
+    if args.compare:
+        rows = compare(current, load_baseline(args.compare), args.tolerance)
+        print(format_comparison(rows))
+        regressions = sum(regressed for *_, regressed in rows)
+        print(f'{regressions} 项回退（容差 {args.tolerance:.0%}）')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
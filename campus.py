@@ -0,0 +1,314 @@
+"""此目的在于模拟整个校园：多个年级、多个班级，寝室可跨班共享，跨班交往弱于班内交往。
+关系按块存储：班内为稠密块（所有班级堆叠为一个三维数组），跨班为稀疏矩阵，不再需要 n×n 的大矩阵"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import numpy as np
+
+from contacts import same_group_pairs
+from freshman import BaseFreshman, StudentPopulation
+from relationship import StructureRelationship, apply_pair_rule, check_state
+from rng import spawn
+
+
+class CampusFreshman(BaseFreshman):
+    """
+    校园新生：在 BaseFreshman 的属性（学号、寝室、兴趣）之外增加年级（cohort）与班级（class）。
+    同一班级的学生学号连续；寝室在同一年级内分配，每个学生以 dorm_mixing 的概率被分进其他班级的寝室，
+    因此会出现跨班共享的寝室。
+    """
+
+    def __init__(self, num_classes=10, class_size=30, cohorts=1, class_sizes=None, dorm_size=4, dorm_mixing=0.2,
+                 seed=None):
+        """
+        :param num_classes: 每个年级的班级数
+        :param class_size: 每个班级的人数
+        :param cohorts: 年级数
+        :param class_sizes: 可选，逐个给出所有班级的人数（长度为 cohorts * num_classes），覆盖 class_size
+        :param dorm_size: 每个寝室的人数上限
+        :param dorm_mixing: 学生被分进其他班级寝室的概率
+        :param seed: 随机数种子（整数、None 或 numpy.random.SeedSequence），默认 None 表示使用操作系统熵，
+                     与 CampusRelationship 相同
+        """
+        if class_sizes is None:
+            class_sizes = [class_size] * (num_classes * cohorts)
+        if len(class_sizes) != num_classes * cohorts:
+            raise ValueError(f"class_sizes 的长度应为 {num_classes * cohorts}，收到 {len(class_sizes)}")
+        self.num_classes = num_classes
+        self.cohorts = cohorts
+        self.class_sizes = np.asarray(class_sizes, dtype=np.int64)
+        self.dorm_mixing = dorm_mixing
+        super().__init__(int(self.class_sizes.sum()), dorm_size=dorm_size, seed=seed)
+
+    def generate_students(self, n):
+        """
+        生成 n 个新生，分配学号、年级、班级、寝室和兴趣爱好。
+        """
+        student_number = np.arange(1, n + 1, dtype=np.int32)
+        class_id = np.repeat(np.arange(len(self.class_sizes), dtype=np.int32), self.class_sizes)
+        cohort = (class_id // self.num_classes).astype(np.int16)
+        interest = self.rng.integers(len(self.interests), size=n, dtype=np.int8)  # 随机选择兴趣爱好
+
+        # 年级内按“班级（少数学生随机换成别的班级）+ 随机次序”排序后，每 dorm_size 人一个寝室
+        dormitory = np.empty(n, dtype=np.int32)
+        next_dormitory = 1
+        for level in range(self.cohorts):
+            members = np.flatnonzero(cohort == level)
+            key = class_id[members].copy()
+            mixed = self.rng.random(len(members)) < self.dorm_mixing
+            key[mixed] = self.rng.choice(np.unique(key), size=int(mixed.sum()))
+            order = members[np.lexsort((self.rng.random(len(members)), key))]
+            dormitory[order] = next_dormitory + np.arange(len(members), dtype=np.int32) // self.dorm_size
+            next_dormitory = int(dormitory[order].max()) + 1
+        self.dormitories = list(range(1, next_dormitory))
+
+        self.students = StudentPopulation(
+            {"student_number": student_number, "cohort": cohort, "class": class_id,
+             "dormitory": dormitory, "interest": interest},
+            categories={"interest": self.interests},
+        )
+
+
+def class_layout(class_codes):
+    """
+    由每个学生的班级编号（同班学生必须连续）得到块结构。
+
+    :param class_codes: 班级编号数组
+    :return: (每个班的起始下标, 每个班的人数)
+    """
+    class_codes = np.asarray(class_codes)
+    boundaries = np.flatnonzero(np.diff(class_codes)) + 1
+    offsets = np.concatenate(([0], boundaries))
+    sizes = np.diff(np.concatenate((offsets, [len(class_codes)])))
+    if len(np.unique(class_codes)) != len(offsets):
+        raise ValueError("同一班级的学生必须连续排列")
+    return offsets, sizes
+
+
+def cross_class_dormitory_pairs(dormitory, class_codes):
+    """
+    返回同寝室但不同班级的学生对 (i, j)，i < j。
+    """
+    pairs = same_group_pairs(dormitory)
+    return pairs[class_codes[pairs[:, 0]] != class_codes[pairs[:, 1]]]
+
+
+class CampusRelationship:
+    """
+    校园关系模拟：
+    - 班内：沿用 StructureRelationship 的规则（标准正态波动，前 50 天同寝室翻倍，兴趣相同按概率加 0.02，
+      结构压力 k·R@R 并截断到 [-20, 20]）。所有班级的关系堆叠为 (班级数, m, m) 的稠密数组（m 为最大班级人数，
+      人数不足的班级用 0 填充），按 chunk_classes 个班级一组做批量矩阵乘法，各组可由线程池并行处理；
+    - 跨班：同寝室的跨班学生每天交往（规则同班内寝室）；此外全校每人每天平均有 cross_rate 次随机的跨班接触，
+      每次波动的标准差为 cross_scale（弱于班内）。跨班关系保存在稀疏矩阵中，不参与结构压力传递。
+    每组班级与跨班接触各自使用 SeedSequence 派生的独立随机数流，结果与线程数无关。
+    """
+    interest_probability = StructureRelationship.interest_probability
+
+    def __init__(self, students, k=0.0015, cross_rate=0.5, cross_scale=0.5, seed=None, dtype=np.float32,
+                 chunk_classes=256, workers=None, cutoff=0.0):
+        """
+        :param students: CampusFreshman 生成的学生（需要 class、dormitory、interest 属性，同班学生连续）
+        :param k: 班内结构压力调节系数
+        :param cross_rate: 每人每天平均的随机跨班接触次数
+        :param cross_scale: 跨班接触的波动标准差
+        :param seed: 随机数种子（整数或 numpy.random.SeedSequence）
+        :param dtype: 班内关系的数据类型（默认 float32，十万人时班内块约 12 MB）
+        :param chunk_classes: 每组批量处理的班级数
+        :param workers: 并行处理各组班级的线程数，None 表示串行
+        :param cutoff: 跨班关系绝对值不超过 cutoff 时不再存储。跨班关系只在发生接触（同寝室或随机接触）的学生对上
+                       产生，存储量由接触次数决定而不是 n²，因此默认 0 即可；cutoff > 0 可进一步剔除弱关系
+        """
+        self.students = students
+        self.num_students = len(students)
+        self.k = k
+        self.cross_rate = cross_rate
+        self.cross_scale = cross_scale
+        self.dtype = np.dtype(dtype)
+        self.chunk_classes = chunk_classes
+        self.workers = workers
+        self.cutoff = cutoff
+
+        codes = {key: np.asarray(students.codes(key)) for key in ('class', 'dormitory', 'interest')}
+        self.class_codes = codes['class']
+        self.offsets, self.sizes = class_layout(self.class_codes)
+        self.num_classes = len(self.offsets)
+        m = int(self.sizes.max())
+        local = np.arange(m)
+        self.valid = local[None, :] < self.sizes[:, None]  # (班级数, m)：哪些位置是真实学生
+        self.members = np.where(self.valid, self.offsets[:, None] + local[None, :], -1)  # 块内位置 -> 全校下标
+        members = np.clip(self.members, 0, None)
+        # 填充位置用互不相同的负数编码，保证不会与任何人“同寝室”或“同兴趣”
+        padding = -1 - np.arange(self.num_classes * m).reshape(self.num_classes, m)
+        self._dormitory = np.where(self.valid, codes['dormitory'][members], padding)
+        self._interest = np.where(self.valid, codes['interest'][members], padding)
+
+        self.blocks = np.zeros((self.num_classes, m, m), dtype=self.dtype)
+        self._buffer = np.empty_like(self.blocks)  # 双缓冲，见 StructureRelationship
+        self._upper = np.triu(np.ones((m, m), dtype=bool), 1)
+
+        self.chunks = [(start, min(start + chunk_classes, self.num_classes))
+                       for start in range(0, self.num_classes, chunk_classes)]
+        chunk_seeds = spawn(seed, len(self.chunks) + 1)
+        self.chunk_rngs = [np.random.default_rng(s) for s in chunk_seeds[:-1]]
+        self.cross_rng = np.random.default_rng(chunk_seeds[-1])
+
+        import scipy.sparse as sp
+
+        self.cross_dormitory_pairs = cross_class_dormitory_pairs(codes['dormitory'], self.class_codes)
+        self.cross = sp.csr_matrix((self.num_students, self.num_students), dtype=np.float64)  # 只存上三角
+
+    def simulate_relationships(self, days=30, checkpointer=None, observers=()):
+        """
+        模拟校园关系变化，接口与 _PairwiseRelationship.simulate_relationships 相同；
+        observers 收到的是全校关系的 CSR 矩阵（每天组装一次，只在有观察者时组装）。
+        """
+        start_day = checkpointer.restore(self, days) if checkpointer is not None else 0
+        for day in range(start_day, days):
+            self._step(day)
+            if observers:
+                matrix = self.get_relationship_matrix()
+                for observer in observers:
+                    observer.observe(day + 1, matrix)
+            if checkpointer is not None:
+                checkpointer.maybe_save(self, day + 1, final=day + 1 == days)
+
+    def _step(self, day):
+        if self.workers is not None and self.workers > 1 and len(self.chunks) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                list(pool.map(lambda index: self._class_step(day, index), range(len(self.chunks))))
+        else:
+            for index in range(len(self.chunks)):
+                self._class_step(day, index)
+        self.blocks, self._buffer = self._buffer, self.blocks
+        self._cross_step(day)
+
+    def _class_step(self, day, index):
+        """
+        一组班级的单日更新：波动与属性规则（只生成上三角再对称），随后批量结构压力并截断，
+        结果写入双缓冲 _buffer 的对应切片。
+        """
+        start, stop = self.chunks[index]
+        rng = self.chunk_rngs[index]
+        blocks = self.blocks[start:stop]
+        dormitory, interest = self._dormitory[start:stop], self._interest[start:stop]
+        valid = self.valid[start:stop]
+        mask = self._upper & valid[:, :, None] & valid[:, None, :]
+
+        change = rng.standard_normal(blocks.shape)
+        matches = (dormitory[:, :, None] == dormitory[:, None, :],  # 各班级内的学生对 (a, b) 一起比较
+                   np.flatnonzero(interest[:, :, None] == interest[:, None, :]))
+        apply_pair_rule(change, day, matches, self.interest_probability, lambda index: rng.random(len(index)))
+        change *= mask
+        change += change.transpose(0, 2, 1)  # 确保对称性
+        blocks += change.astype(self.dtype, copy=False)
+
+        out = self._buffer[start:stop]
+        np.matmul(blocks, blocks, out=out)  # 对角线为 0，无需减去 c==a、c==b 两项
+        out *= self.k
+        diagonal = np.arange(out.shape[1])
+        out[:, diagonal, diagonal] = 0  # a==b 时不做压力传递
+        out += blocks
+        np.clip(out, -20, 20, out=out)
+
+    def _cross_step(self, day):
+        """
+        跨班关系的单日更新：同寝室的跨班学生对每天交往，另加随机的跨班接触。
+        """
+        import scipy.sparse as sp
+
+        rng = self.cross_rng
+        pairs = self.cross_dormitory_pairs
+        dormitory_change = rng.standard_normal(len(pairs)) * (2 if day < 50 else 1)
+
+        count = rng.poisson(self.cross_rate * self.num_students / 2)
+        first = rng.integers(self.num_students, size=count)
+        second = rng.integers(self.num_students, size=count)
+        contact_change = rng.normal(0, self.cross_scale, size=count)
+        keep = self.class_codes[first] != self.class_codes[second]
+        low, high = np.minimum(first, second)[keep], np.maximum(first, second)[keep]
+
+        rows = np.concatenate((pairs[:, 0], low))
+        cols = np.concatenate((pairs[:, 1], high))
+        values = np.concatenate((dormitory_change, contact_change[keep]))
+        change = sp.csr_matrix((values, (rows, cols)), shape=self.cross.shape)  # 重复的学生对自动累加
+        cross = (self.cross + change).tocsr()
+        np.clip(cross.data, -20, 20, out=cross.data)
+        cross.data[np.abs(cross.data) <= self.cutoff] = 0
+        cross.eliminate_zeros()
+        self.cross = cross
+
+    def class_matrix(self, class_index):
+        """
+        返回某个班级的班内关系矩阵（稠密，去掉填充部分）。
+        """
+        size = self.sizes[class_index]
+        return self.blocks[class_index, :size, :size]
+
+    def cross_matrix(self):
+        """
+        返回对称的跨班关系 CSR 矩阵（全校 n×n）。
+        """
+        return (self.cross + self.cross.T).tocsr()
+
+    def get_relationship_matrix(self):
+        """
+        组装全校关系的 CSR 矩阵（班内块对角 + 跨班稀疏），可直接用于 network.convert_to_adjacency_matrix。
+        """
+        import scipy.sparse as sp
+
+        class_index, row, col = np.nonzero(self.blocks)
+        inside = sp.csr_matrix((self.blocks[class_index, row, col].astype(np.float64),
+                                (self.members[class_index, row], self.members[class_index, col])),
+                               shape=self.cross.shape)
+        return (inside + self.cross_matrix()).tocsr()
+
+    def settings(self):
+        """
+        决定模拟结果的设置，保存在状态中；续跑时必须一致（见 relationship.check_state）。
+        """
+        return {'k': float(self.k), 'cross_rate': float(self.cross_rate), 'cross_scale': float(self.cross_scale),
+                'dtype': self.dtype.name, 'cutoff': float(self.cutoff), 'chunk_classes': int(self.chunk_classes)}
+
+    def get_state(self):
+        """
+        返回可续跑的模拟状态，值均为 NumPy 数组（可交给 checkpoint.Checkpointer 保存）。
+        """
+        return {
+            'class_name': np.array(type(self).__name__),
+            'num_students': np.array(self.num_students),
+            'settings': np.array(json.dumps(self.settings())),
+            'blocks': self.blocks,
+            'cross_data': self.cross.data,
+            'cross_indices': self.cross.indices,
+            'cross_indptr': self.cross.indptr,
+            'rng_state': np.array(json.dumps([rng.bit_generator.state for rng in self.chunk_rngs + [self.cross_rng]])),
+        }
+
+    def set_state(self, state):
+        """
+        从 get_state 的结果恢复模拟状态。
+        """
+        import scipy.sparse as sp
+
+        check_state(self, state)
+        self.blocks = np.array(state['blocks'], dtype=self.dtype)
+        self._buffer = np.empty_like(self.blocks)
+        self.cross = sp.csr_matrix((state['cross_data'], state['cross_indices'], state['cross_indptr']),
+                                   shape=(self.num_students, self.num_students))
+        for rng, rng_state in zip(self.chunk_rngs + [self.cross_rng], json.loads(str(state['rng_state']))):
+            rng.bit_generator.state = rng_state
+
+
+if __name__ == '__main__':  # 检验代码：十万人校园模拟 30 天
+    import time
+
+    start = time.perf_counter()
+    campus = CampusFreshman(num_classes=834, class_size=30, cohorts=4, seed=42)
+    students = campus.get_students()
+    relationships = CampusRelationship(students, seed=42, workers=4)
+    relationships.simulate_relationships(days=30)
+    matrix = relationships.get_relationship_matrix()
+    print(f"{len(students)} 名学生，{relationships.num_classes} 个班级，"
+          f"跨班同寝室 {len(relationships.cross_dormitory_pairs)} 对，关系非零元素 {matrix.nnz}，"
+          f"用时 {time.perf_counter() - start:.1f} 秒")
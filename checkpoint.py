@@ -0,0 +1,94 @@
+"""此目的在于为长时间的模拟定期保存检查点，并支持从最近的检查点续跑"""
+import glob
+import os
+
+import numpy as np
+
+
+def save_checkpoint(path, relationships, day):
+    """
+    将关系类的状态与已模拟天数写入 .npz 文件（不压缩，写入速度接近磁盘带宽）。
+    先写临时文件再原子替换，写到一半被杀死不会破坏已有检查点。
+
+    :param path: 检查点文件路径
+    :param relationships: 关系类实例（需提供 get_state）
+    :param day: 已完成的天数
+    """
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez(file, day=np.array(day), **relationships.get_state())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    """
+    读取检查点文件，返回 {名称: 数组}，其中 'day' 为已完成的天数。
+    可以单独用于查看中途的关系矩阵（'matrix'）。
+
+    :param path: 检查点文件路径
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+class Checkpointer:
+    """
+    传给 simulate_relationships 的检查点管理器：每 every 天保存一次，
+    只保留最近 keep 个检查点；模拟开始时若目录中已有检查点则自动续跑。
+    """
+
+    def __init__(self, directory, every=10, keep=2):
+        """
+        :param directory: 检查点目录
+        :param every: 保存间隔（天）
+        :param keep: 保留的检查点数量
+        """
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def checkpoints(self):
+        """
+        返回目录中的检查点文件，按天数从小到大排列。
+        """
+        return sorted(glob.glob(os.path.join(self.directory, 'checkpoint_*.npz')))
+
+    def latest(self):
+        """
+        返回最近的检查点路径，没有时返回 None。
+        """
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, relationships, day):
+        """
+        立即保存第 day 天的检查点，并删除多余的旧检查点。
+        """
+        save_checkpoint(os.path.join(self.directory, f'checkpoint_{day:07d}.npz'), relationships, day)
+        for path in self.checkpoints()[:-self.keep]:
+            os.remove(path)
+
+    def maybe_save(self, relationships, day, final=False):
+        """
+        到达保存间隔或模拟结束时保存检查点。
+        """
+        if final or day % self.every == 0:
+            self.save(relationships, day)
+
+    def restore(self, relationships, days=None):
+        """
+        若存在检查点，则将其恢复到 relationships 中。设置不一致（见 relationship.check_state）
+        或检查点已超过要模拟的天数时抛出 ValueError。
+        :param days: 要模拟到的天数，None 表示不检查
+        :return: 已完成的天数（没有检查点时为 0）
+        """
+        path = self.latest()
+        if path is None:
+            return 0
+        state = load_checkpoint(path)
+        day = int(state['day'])
+        if days is not None and day > days:
+            raise ValueError(f"检查点 {path} 已模拟到第 {day} 天，超过了要模拟的 {days} 天")
+        relationships.set_state(state)
+        return day
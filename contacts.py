@@ -0,0 +1,129 @@
+"""此目的在于描述学生之间“谁和谁见面”的接触模型，事件驱动模式下只更新当天真正交往的学生对"""
+import numpy as np
+
+
+def same_group_pairs(labels):
+    """
+    返回标签相同的全部学生对 (i, j)，i < j（按标签排序后逐个间隔比较，适合每组人数较少的分组）。
+
+    :param labels: 每个学生的分组标签（负数表示不属于任何组）
+    :return: (对数, 2) 的整数数组
+    """
+    labels = np.asarray(labels)
+    order = np.lexsort((np.arange(len(labels)), labels))
+    order = order[labels[order] >= 0]
+    sorted_labels = labels[order]
+    rows, cols = [], []
+    for offset in range(1, len(order)):
+        same = sorted_labels[offset:] == sorted_labels[:-offset]
+        if not same.any():
+            break  # 按标签排序后，间隔更大的学生不可能同组
+        rows.append(order[:-offset][same])
+        cols.append(order[offset:][same])
+    if not rows:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.sort(np.column_stack((np.concatenate(rows), np.concatenate(cols))), axis=1).astype(np.int64)
+
+
+class ContactModel:
+    """
+    接触模型：决定每天哪些学生对发生交往。
+    - 同寝室：每天交往；
+    - 兴趣小组：同兴趣的学生每 club_size 人组成一个小组，每 interest_period 天聚会一次（各小组错开日期），
+      组内两两交往；
+    - 随机相遇：每人每天平均 random_rate 次，对象在全体学生中均匀随机。
+    每天的交往次数约为 O(n)，与 n² 无关。
+    """
+
+    def __init__(self, dormitory=True, interest_period=7, club_size=8, random_rate=1.0, seed=None):
+        """
+        :param dormitory: 同寝室学生是否每天交往
+        :param interest_period: 兴趣小组的聚会周期（天），None 表示没有兴趣小组
+        :param club_size: 兴趣小组人数
+        :param random_rate: 每人每天的平均随机相遇次数
+        :param seed: 兴趣小组分组与聚会日期的随机种子；None（默认）时由关系类从自己的种子派生，
+                     因此每次重复、每个参数组合的分组都不同，续跑时由检查点恢复同样的分组
+        """
+        self.dormitory = dormitory
+        self.interest_period = interest_period
+        self.club_size = club_size
+        self.random_rate = random_rate
+        self.seed = seed
+        self.num_students = 0
+        self.dormitory_pairs = np.zeros((0, 2), dtype=np.int64)
+        self.club_pairs = {}  # 聚会日（天数 % interest_period）-> 学生对
+
+    def prepare(self, num_students, attribute_codes):
+        """
+        根据学生属性预先计算固定的接触结构（寝室学生对、兴趣小组学生对）。
+
+        :param num_students: 学生数量
+        :param attribute_codes: {属性名: 整数编码数组}，缺少 dormitory 或 interest 时跳过相应的接触
+        """
+        self.num_students = num_students
+        if self.dormitory and 'dormitory' in attribute_codes:
+            self.dormitory_pairs = same_group_pairs(attribute_codes['dormitory'])
+        self.club_pairs = {}
+        if self.interest_period and 'interest' in attribute_codes:
+            rng = np.random.default_rng(self.seed)
+            interest = np.asarray(attribute_codes['interest'])
+            club = np.empty(num_students, dtype=np.int64)
+            next_club = 0
+            for value in np.unique(interest):
+                members = rng.permutation(np.flatnonzero(interest == value))
+                club[members] = next_club + np.arange(len(members)) // self.club_size
+                next_club = int(club[members].max()) + 1
+            pairs = same_group_pairs(club)
+            meeting_day = rng.integers(self.interest_period, size=next_club)  # 各小组错开聚会日期
+            pair_day = meeting_day[club[pairs[:, 0]]]
+            self.club_pairs = {day: pairs[pair_day == day] for day in range(self.interest_period)}
+        return self
+
+    def interactions(self, day, rng):
+        """
+        抽取第 day 天发生的全部交往。
+
+        :param day: 天数
+        :param rng: numpy 随机数生成器（随机相遇）
+        :return: (rows, cols)，rows < cols；同一学生对一天内可能出现多次
+        """
+        parts = [self.dormitory_pairs]
+        if self.club_pairs:
+            parts.append(self.club_pairs[day % self.interest_period])
+        count = rng.poisson(self.random_rate * self.num_students / 2)
+        first = rng.integers(self.num_students, size=count)
+        second = rng.integers(self.num_students, size=count)
+        distinct = first != second
+        parts.append(np.sort(np.column_stack((first[distinct], second[distinct])), axis=1))
+        pairs = np.concatenate(parts)
+        return pairs[:, 0], pairs[:, 1]
+
+    def expected_interactions(self):
+        """
+        平均每天的交往次数。
+        """
+        clubs = sum(len(pairs) for pairs in self.club_pairs.values()) / (self.interest_period or 1)
+        return len(self.dormitory_pairs) + clubs + self.random_rate * self.num_students / 2
+
+
+if __name__ == '__main__':  # 检验代码：事件驱动模式下稠密与稀疏存储结果一致，且只更新交往过的学生对
+    from freshman import BaseFreshman
+    from relationship import StructureRelationship
+
+    students = BaseFreshman(200, seed=0).get_students()
+    dense = StructureRelationship(students, update_mode='event', seed=0)
+    sparse = StructureRelationship(students, update_mode='event', seed=0, storage='sparse')
+    for day in range(10):
+        dense._step(day)
+        sparse._step(day)
+    assert np.allclose(dense.relationship_matrix, sparse.relationship_matrix.toarray())
+    # 兴趣小组由关系类的种子派生：不同种子分组不同，续跑（set_state）后分组不变
+    other = StructureRelationship(students, update_mode='event', seed=1)
+    assert any(not np.array_equal(dense.contact_model.club_pairs[day], other.contact_model.club_pairs[day])
+               for day in dense.contact_model.club_pairs)
+    other.set_state(dense.get_state())
+    assert all(np.array_equal(dense.contact_model.club_pairs[day], other.contact_model.club_pairs[day])
+               for day in dense.contact_model.club_pairs)
+    touched = np.count_nonzero(np.triu(dense.relationship_matrix, 1))
+    print(f'平均每天交往 {dense.contact_model.expected_interactions():.0f} 次，10 天后 {touched} 对学生有关系'
+          f'（共 {200 * 199 // 2} 对），稠密与稀疏存储结果一致')
@@ -0,0 +1,253 @@
+"""此目的在于并行运行多次独立重复（Monte Carlo）模拟，并以流式方式汇总结果"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import os
+
+import numpy as np
+
+from freshman import BaseFreshman, InitialFreshman
+from network import calculate_centrality, convert_to_adjacency_matrix
+from relationship import BaseRelationship, InitialRelationship, StructureRelationship
+from rng import replica_seeds, replica_streams
+
+# 模型名 -> (新生类, 关系类)
+MODELS = {
+    'initial': (InitialFreshman, InitialRelationship),
+    'base': (BaseFreshman, BaseRelationship),
+    'structure': (BaseFreshman, StructureRelationship),
+}
+
+EXECUTORS = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}  # 并行方式 -> 执行器类
+
+CENTRALITY_COLUMNS = ["degree_centrality", "betweenness_centrality", "closeness_centrality",
+                      "eigenvector_centrality"]
+
+
+class StreamingStats:
+    """
+    逐个样本累计均值、方差（Welford 算法），并可选地统计分位数（固定区间直方图），
+    内存只与单个样本的形状有关，与样本数量无关。
+    均值与方差各占样本大小 × 8 字节；分位数直方图另占 样本大小 × bins × 计数类型字节数，
+    对 n×n 的关系矩阵而言远大于单个样本，因此默认不统计（bins=0）。
+    """
+
+    def __init__(self, shape, value_range, bins=0, quantiles=(0.05, 0.5, 0.95), count_dtype=np.uint16):
+        """
+        :param shape: 单个样本的形状
+        :param value_range: (最小值, 最大值)，超出范围的值计入两端的区间
+        :param bins: 直方图区间数，决定分位数的分辨率；为 0（默认）时不统计分位数
+        :param quantiles: 需要输出的分位数
+        :param count_dtype: 直方图计数的整数类型，须能容纳样本数（uint16 最多 65535 个样本）
+        """
+        self.shape = tuple(shape)
+        self.low, self.high = value_range
+        self.bins = bins
+        self.quantiles = tuple(quantiles)
+        self.count = 0
+        self.mean = np.zeros(self.shape)
+        self._m2 = np.zeros(self.shape)  # 与均值之差的平方和
+        self._histogram = np.zeros((int(np.prod(self.shape)), bins), dtype=count_dtype) if bins else None
+
+    def update(self, sample):
+        """
+        加入一个样本。
+        :param sample: 形状为 shape 的数组
+        """
+        sample = np.asarray(sample, dtype=float)
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (sample - self.mean)
+        if self._histogram is not None:
+            width = (self.high - self.low) / self.bins
+            index = np.clip(((sample.ravel() - self.low) // width).astype(np.int64), 0, self.bins - 1)
+            self._histogram[np.arange(len(index)), index] += 1
+
+    def variance(self):
+        """
+        样本方差（ddof=1），样本数不足 2 时为 0。
+        """
+        if self.count < 2:
+            return np.zeros(self.shape)
+        return self._m2 / (self.count - 1)
+
+    def quantile(self, q):
+        """
+        根据直方图线性插值估计分位数，误差不超过一个区间宽度。
+        :param q: 0 到 1 之间的分位点
+        """
+        if self._histogram is None:
+            raise ValueError("bins=0 时不统计分位数")
+        cumulative = np.cumsum(self._histogram, axis=1)
+        target = q * self.count
+        position = np.argmax(cumulative >= target, axis=1)  # 第一个累计频数达到目标的区间
+        rows = np.arange(len(position))
+        before = np.where(position > 0, cumulative[rows, position - 1], 0)
+        inside = np.maximum(self._histogram[rows, position], 1)
+        width = (self.high - self.low) / self.bins
+        value = self.low + (position + (target - before) / inside) * width
+        return value.reshape(self.shape)
+
+    def summary(self):
+        """
+        返回汇总结果字典：样本数、均值、方差与各分位数。
+        """
+        result = {'count': self.count, 'mean': self.mean.copy(), 'variance': self.variance()}
+        if self._histogram is not None:
+            result['quantiles'] = {q: self.quantile(q) for q in self.quantiles}
+        return result
+
+
+def simulate_replica(model, num_students, days, seed_sequence, relationship_options=None, freshman_options=None):
+    """
+    运行一次独立模拟并返回最终关系矩阵。
+    新生生成与每日波动各自使用 seed_sequence 派生出的独立随机数流（见 rng.replica_streams），
+    结果只由 seed_sequence 决定，与在哪个线程或进程中运行无关。
+
+    :param model: 'initial'、'base' 或 'structure'
+    :param num_students: 新生数量
+    :param days: 模拟天数
+    :param seed_sequence: 本次模拟的 numpy.random.SeedSequence
+    :param relationship_options: 传给关系类的其他参数（如 k、dtype）
+    :param freshman_options: 传给新生类的其他参数（如 dorm_size）
+    :return: 最终关系矩阵
+    """
+    freshman_class, relationship_class = MODELS[model]
+    streams = replica_streams(seed_sequence)
+    if freshman_class is InitialFreshman:
+        students = freshman_class(num_students).get_students()
+    else:
+        students = freshman_class(num_students, seed=streams['population'], **(freshman_options or {})).get_students()
+
+    options = dict(relationship_options or {})
+    options.setdefault('update_mode', 'batch')
+    relationships = relationship_class(students, seed=streams['noise'], **options)
+    relationships.simulate_relationships(days=days)
+    return relationships.get_relationship_matrix()
+
+
+def centrality_array(adjacency_matrix):
+    """
+    计算中心性并整理为 n×4 数组，列顺序见 CENTRALITY_COLUMNS。
+    """
+    centrality = calculate_centrality(adjacency_matrix)
+    return np.column_stack([centrality[column] for column in CENTRALITY_COLUMNS])
+
+
+def run_replica(model, num_students, days, seed_sequence, threshold=5, relationship_options=None):
+    """
+    运行一次独立重复：生成新生、模拟关系、计算邻接矩阵与中心性。
+
+    :param model: 'initial'、'base' 或 'structure'
+    :param num_students: 新生数量
+    :param days: 模拟天数
+    :param seed_sequence: 本次重复的 numpy.random.SeedSequence
+    :param threshold: 邻接矩阵阈值
+    :param relationship_options: 传给关系类的其他参数（如 k、dtype）
+    :return: (最终关系矩阵, n×4 的中心性数组)
+    """
+    matrix = simulate_replica(model, num_students, days, seed_sequence, relationship_options)
+    centrality = centrality_array(convert_to_adjacency_matrix(matrix, threshold=threshold))
+    if not isinstance(matrix, np.ndarray):  # 稀疏存储时转回稠密数组再汇总
+        matrix = matrix.toarray()
+    return matrix, centrality
+
+
+def run_ensemble(model='structure', replicas=10, num_students=30, days=30, seed=42, threshold=5,
+                 workers=None, max_pending=None, quantiles=(0.05, 0.5, 0.95), bins=200, matrix_bins=0,
+                 matrix_range=None, executor='process', **relationship_options):
+    """
+    用进程池（或线程池）运行 replicas 次独立重复，并按重复编号顺序流式汇总最终关系矩阵和中心性表。
+    同时在途（运行中或等待汇总）的重复不超过 max_pending 个，因此内存不随 replicas 增长。
+    汇总本身的内存：关系矩阵的均值与方差共 n²×16 字节；关系矩阵的逐元素分位数须显式开启（matrix_bins > 0），
+    另占 n²×matrix_bins×2 字节（n=1000、matrix_bins=200 时约 400 MB）；中心性表只有 n×4 个元素，
+    其分位数（bins）默认开启，开销可以忽略。
+    每次重复的随机数流只由 seed 与重复编号决定，串行、多线程与多进程的结果逐位相同。
+
+    :param model: 'initial'、'base' 或 'structure'
+    :param replicas: 重复次数
+    :param num_students: 每次重复的新生数量
+    :param days: 模拟天数
+    :param seed: 根种子，各重复的随机数流由 rng.replica_seeds 派生
+    :param threshold: 邻接矩阵阈值
+    :param workers: 进程数，默认 CPU 核数；0 表示在当前进程内串行运行
+    :param max_pending: 同时在途的重复数上限，默认 2×workers
+    :param quantiles: 需要输出的分位数
+    :param bins: 中心性分位数直方图的区间数，0 表示不统计
+    :param matrix_bins: 关系矩阵逐元素分位数直方图的区间数，默认 0（只汇总均值与方差）
+    :param matrix_range: 关系矩阵分位数直方图的取值范围，默认按模型估计
+    :param executor: 并行方式，'process'（默认）或 'thread'（NumPy 运算释放 GIL，适合大矩阵的 batch 模式）
+    :param relationship_options: 传给关系类的其他参数（如 k、dtype）
+    :return: {'matrix': 汇总字典, 'centrality': 汇总字典, 'centrality_columns': 列名}
+    """
+    if matrix_range is None:
+        # 结构模型被截断在 [-20, 20]；其他模型为随机游走，取 8 倍日标准差（含寝室翻倍）
+        matrix_range = (-20, 20) if model == 'structure' else (-8 * np.sqrt(days), 8 * np.sqrt(days))
+    count_dtype = np.uint16 if replicas <= np.iinfo(np.uint16).max else np.uint32
+    matrix_stats = StreamingStats((num_students, num_students), matrix_range, matrix_bins, quantiles, count_dtype)
+    centrality_stats = StreamingStats((num_students, len(CENTRALITY_COLUMNS)), (0, 1), bins, quantiles,
+                                      count_dtype)
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor 必须是 {tuple(EXECUTORS)} 之一，收到 {executor!r}")
+    children = replica_seeds(seed, replicas)
+    arguments = [(model, num_students, days, child, threshold, relationship_options) for child in children]
+
+    def consume(result):
+        matrix, centrality = result
+        matrix_stats.update(matrix)
+        centrality_stats.update(centrality)
+
+    if workers == 0:
+        for args in arguments:
+            consume(run_replica(*args))
+    else:
+        workers = workers or os.cpu_count()
+        max_pending = max_pending or 2 * workers
+        finished = {}  # 已完成但还未轮到汇总的重复（保证汇总顺序与串行一致）
+        next_index = 0
+        with EXECUTORS[executor](max_workers=workers) as pool:
+            running = {}
+            for index, args in enumerate(arguments):
+                while len(running) + len(finished) >= max_pending:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished[running.pop(future)] = future.result()
+                    while next_index in finished:
+                        consume(finished.pop(next_index))
+                        next_index += 1
+                running[pool.submit(run_replica, *args)] = index
+            for future in list(running):
+                finished[running.pop(future)] = future.result()
+            while next_index in finished:
+                consume(finished.pop(next_index))
+                next_index += 1
+
+    return {
+        'matrix': matrix_stats.summary(),
+        'centrality': centrality_stats.summary(),
+        'centrality_columns': CENTRALITY_COLUMNS,
+    }
+
+
+def centrality_summary_frame(result):
+    """
+    将 run_ensemble 的中心性汇总整理为 DataFrame，每个指标对应均值、方差和各分位数列。
+
+    :param result: run_ensemble 的返回值
+    :return: pandas.DataFrame
+    """
+    import pandas as pd
+
+    summary = result['centrality']
+    num_nodes = summary['mean'].shape[0]
+    frame = {'Node': list(range(1, num_nodes + 1))}
+    for index, column in enumerate(result['centrality_columns']):
+        frame[f"{column}_mean"] = summary['mean'][:, index]
+        frame[f"{column}_variance"] = summary['variance'][:, index]
+        for q, values in summary.get('quantiles', {}).items():
+            frame[f"{column}_q{q:g}"] = values[:, index]
+    return pd.DataFrame(frame)
+
+
+if __name__ == '__main__':  # 检验代码
+    ensemble = run_ensemble('structure', replicas=8, num_students=30, days=30)
+    print(centrality_summary_frame(ensemble).head())
@@ -0,0 +1,186 @@
+"""此目的在于将每次运行的关系矩阵、中心性表与运行元数据写入按模型分区的结果数据集，便于批量读取"""
+import datetime
+import glob
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+FORMATS = ('npz', 'parquet')
+
+
+def new_run_id():
+    """
+    生成按时间排序、并发运行之间不会冲突的运行编号。
+    """
+    return f"{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class ResultDataset:
+    """
+    结果数据集：每次运行一个目录 {root}/model={模型}/run={运行编号}/，其中
+    - meta.json：运行参数、种子、各阶段耗时等元数据；
+    - matrix.npz：最终关系矩阵（压缩；稀疏矩阵以 CSR 格式保存）；
+    - centrality.npz 或 centrality.parquet：中心性表（每个学生一行）。
+    运行目录先写到临时目录再整体改名，并发写入或中途退出不会留下不完整的运行。
+    Parquet 需要 pyarrow（或 fastparquet），默认的 npz 只依赖 NumPy。
+    """
+
+    def __init__(self, root='./output/dataset', format='npz'):
+        """
+        :param root: 数据集根目录
+        :param format: 中心性表的格式，'npz' 或 'parquet'
+        """
+        if format not in FORMATS:
+            raise ValueError(f"format 必须是 {FORMATS} 之一，收到 {format!r}")
+        self.root = root
+        self.format = format
+
+    def run_directory(self, model, run_id):
+        return os.path.join(self.root, f'model={model}', f'run={run_id}')
+
+    def write_run(self, model, relationship_matrix, centrality, metadata=None, run_id=None):
+        """
+        写入一次运行的结果。
+
+        :param model: 模型名称（分区键）
+        :param relationship_matrix: 最终关系矩阵（稠密或 scipy.sparse）
+        :param centrality: calculate_centrality 格式的字典（列名 -> 每个学生的值）
+        :param metadata: 运行元数据（参数、种子、耗时等），需可序列化为 JSON
+        :param run_id: 运行编号，默认自动生成
+        :return: 运行编号
+        """
+        run_id = run_id or new_run_id()
+        directory = self.run_directory(model, run_id)
+        temporary = f'{directory}.{os.getpid()}.tmp'
+        os.makedirs(temporary, exist_ok=True)
+        try:
+            sparse = not isinstance(relationship_matrix, np.ndarray) and hasattr(relationship_matrix, 'tocsr')
+            if sparse:
+                import scipy.sparse as sp
+
+                sp.save_npz(os.path.join(temporary, 'matrix.npz'), relationship_matrix.tocsr(), compressed=True)
+            else:
+                np.savez_compressed(os.path.join(temporary, 'matrix.npz'), matrix=np.asarray(relationship_matrix))
+
+            columns = {name: np.asarray(values) for name, values in centrality.items()}
+            if self.format == 'npz':
+                np.savez_compressed(os.path.join(temporary, 'centrality.npz'), **columns)
+            else:
+                import pandas as pd
+
+                pd.DataFrame(columns).to_parquet(os.path.join(temporary, 'centrality.parquet'), index=False)
+
+            meta = dict(metadata or {}, model=model, run_id=run_id, format=self.format,
+                        matrix_storage='sparse' if sparse else 'dense',
+                        created=datetime.datetime.now().isoformat(timespec='seconds'))
+            with open(os.path.join(temporary, 'meta.json'), 'w', encoding='utf-8') as file:
+                json.dump(meta, file, ensure_ascii=False, indent=2, default=_json_default)
+            os.replace(temporary, directory)
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        return run_id
+
+    def runs(self, model=None):
+        """
+        返回 [(模型, 运行编号)]，按模型与运行编号排序（运行编号以写入时间开头）。
+        """
+        pattern = os.path.join(self.root, f'model={model or "*"}', 'run=*')
+        result = []
+        for directory in sorted(glob.glob(pattern)):
+            if directory.endswith('.tmp') or not os.path.exists(os.path.join(directory, 'meta.json')):
+                continue
+            run_id = os.path.basename(directory)[len('run='):]
+            result.append((os.path.basename(os.path.dirname(directory))[len('model='):], run_id))
+        return result
+
+    def load_metadata(self, model, run_id):
+        """
+        读取一次运行的元数据字典。
+        """
+        with open(os.path.join(self.run_directory(model, run_id), 'meta.json'), encoding='utf-8') as file:
+            return json.load(file)
+
+    def load_matrix(self, model, run_id):
+        """
+        读取一次运行的关系矩阵（按保存时的形式返回稠密数组或 CSR 矩阵）。
+        """
+        path = os.path.join(self.run_directory(model, run_id), 'matrix.npz')
+        if self.load_metadata(model, run_id)['matrix_storage'] == 'sparse':
+            import scipy.sparse as sp
+
+            return sp.load_npz(path)
+        with np.load(path, allow_pickle=False) as data:
+            return data['matrix']
+
+    def load_centrality(self, model, run_id):
+        """
+        读取一次运行的中心性表，返回 {列名: 数组}。
+        """
+        directory = self.run_directory(model, run_id)
+        if os.path.exists(os.path.join(directory, 'centrality.npz')):
+            with np.load(os.path.join(directory, 'centrality.npz'), allow_pickle=False) as data:
+                return {name: data[name] for name in data.files}
+        import pandas as pd
+
+        frame = pd.read_parquet(os.path.join(directory, 'centrality.parquet'))
+        return {name: frame[name].to_numpy() for name in frame.columns}
+
+    def metadata_frame(self, model=None):
+        """
+        所有运行的元数据汇总为一个 DataFrame（每次运行一行，嵌套字典展开为 a.b 形式的列）。
+        """
+        import pandas as pd
+
+        return pd.json_normalize([self.load_metadata(*run) for run in self.runs(model)])
+
+    def centrality_frame(self, model=None, runs=None):
+        """
+        把多次运行的中心性表拼接为一个长表，并加上 model、run_id 两列。
+
+        :param model: 只读取该模型的运行，None 表示全部
+        :param runs: 只读取这些 (模型, 运行编号)，默认 self.runs(model)
+        """
+        import pandas as pd
+
+        frames = []
+        for run_model, run_id in runs if runs is not None else self.runs(model):
+            frame = pd.DataFrame(self.load_centrality(run_model, run_id))
+            frame.insert(0, 'run_id', run_id)
+            frame.insert(0, 'model', run_model)
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def to_excel(self, model, run_id, path):
+        """
+        由数据集中的一次运行派生 Excel 表格（需要 openpyxl）。
+        """
+        import pandas as pd
+
+        pd.DataFrame(self.load_centrality(model, run_id)).to_excel(path, index=False)
+
+
+if __name__ == '__main__':  # 检验代码：写入两次运行后读回
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as root:
+        dataset = ResultDataset(root)
+        matrix = np.arange(9.0).reshape(3, 3)
+        centrality = {'Node': [1, 2, 3], 'degree_centrality': [0.5, 1.0, 0.5]}
+        first = dataset.write_run('structure', matrix, centrality, {'seed': 1, 'timings': {'simulation': 0.1}})
+        second = dataset.write_run('structure', matrix * 2, centrality, {'seed': 2})
+        assert [run for _, run in dataset.runs('structure')] == sorted([first, second])
+        assert np.array_equal(dataset.load_matrix('structure', second), matrix * 2)
+        print(dataset.centrality_frame())
+        print(dataset.metadata_frame()[['run_id', 'seed', 'timings.simulation']])
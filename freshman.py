@@ -1,5 +1,77 @@
 # 该文档的目的在于生成不同属性的新生，由简单到复杂逐步进行
-import random
+import numpy as np
+
+
+class StudentPopulation:
+    """
+    列式存储的新生群体：每个属性是一列 NumPy 数组，类别属性在列中保存整数编码，
+    取值表另存于 categories。按下标访问时返回与原来相同的字典，
+    因此仍可以当作“学生字典列表”传给 visualize_social_network_attribute 等旧接口。
+    """
+
+    def __init__(self, columns, categories=None):
+        """
+        :param columns: {属性名: 一维数组}，各列长度相同，顺序即学生顺序
+        :param categories: {属性名: 取值表}，对应列中存放的是取值表的下标
+        """
+        self.columns = dict(columns)
+        self.categories = {key: list(values) for key, values in (categories or {}).items()}
+        lengths = {len(column) for column in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"各属性列长度不一致：{lengths}")
+        self._size = lengths.pop() if lengths else 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        """
+        兼容视图：整数下标返回单个学生字典，切片返回字典列表。
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        student = {}
+        for key, column in self.columns.items():
+            value = column[index].item()
+            if key in self.categories:
+                value = self.categories[key][value]
+            student[key] = value
+        return student
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def __repr__(self):
+        return f"StudentPopulation(n={self._size}, attributes={list(self.columns)})"
+
+    def codes(self, key):
+        """
+        返回属性 key 的整数编码数组（类别属性直接返回存储的编码，不做任何字典查找）。
+        :param key: 属性名
+        """
+        column = self.columns[key]
+        if key in self.categories:
+            return column
+        return np.unique(column, return_inverse=True)[1]
+
+    def column(self, key):
+        """
+        返回属性 key 的原始取值数组（类别属性会解码为取值）。
+        :param key: 属性名
+        """
+        column = self.columns[key]
+        if key in self.categories:
+            return np.asarray(self.categories[key], dtype=object)[column]
+        return column
+
+    def to_records(self):
+        """
+        转换为字典列表（与旧版 generate_students 的输出一致）。
+        """
+        return list(self)
+
+
 class InitialFreshman:
     def __init__(self, n):
         """
@@ -8,7 +80,7 @@ class InitialFreshman:
 
         :param n: 要生成的新生数量
         """
-        self.students = []  # 用于存储生成的新生
+        self.students = None  # 用于存储生成的新生（StudentPopulation）
         self.generate_students(n)
 
     def generate_students(self, n):
@@ -16,9 +88,8 @@ class InitialFreshman:
         生成 n 个新生，每个新生分配一个唯一的学号。
         学号从 1 开始递增。
         """
-        for i in range(1, n + 1):
-            student = {"student_number": i}  # 用字典表示新生，以便存储更多的属性
-            self.students.append(student)
+        self.students = StudentPopulation({"student_number": np.arange(1, n + 1, dtype=np.int32)})
+
     def get_students(self):
         """
         返回生成的新生列表。
@@ -28,16 +99,21 @@ class InitialFreshman:
 
 
 class BaseFreshman:
-    def __init__(self, n):
+    def __init__(self, n, dorm_size=4, seed=None):
         """
         初始化 BaseFreshman 类，并生成 n 个新生。
         每个新生有(学号，寝室，兴趣爱好)。
 
         :param n: 要生成的新生数量
+        :param dorm_size: 每个寝室的人数上限，默认 4
+        :param seed: 随机数种子（整数、None 或 numpy.random.SeedSequence，用于兴趣与寝室分配）；
+                     与关系类相同，默认 None 表示使用操作系统熵，需要复现时显式给出（main.simulate 由配置的 seed 派生）
         """
-        self.students = []  # 用于存储生成的新生
+        self.students = None  # 用于存储生成的新生（StudentPopulation）
         self.dormitories = []  # 存储寝室信息
         self.interests = ["网游", "历史", "桌游", "手游", "追剧"]  # 5大类兴趣爱好
+        self.dorm_size = dorm_size
+        self.rng = np.random.default_rng(seed)
         self.generate_students(n)
 
     def generate_students(self, n):
@@ -46,24 +122,19 @@ class BaseFreshman:
         学号从 1 开始递增，寝室随机分配，兴趣爱好随机分配。
         """
         # 生成学号和兴趣爱好
-        for i in range(1, n + 1):
-            student = {
-                "student_number": i,
-                "dormitory": None,  # 待分配的寝室
-                "interest": random.choice(self.interests)  # 随机选择兴趣爱好
-            }
-            self.students.append(student)
-
-        # 随机打乱学生顺序
-        random.shuffle(self.students)
-        # 随机分配寝室，每个寝室最多 4 人
-        dormitory_number = 1
-        for i in range(0, n, 4):  # 每次处理最多 4 个学生
-            dorm = self.students[i:i + 4]
-            for student in dorm:
-                student["dormitory"] = dormitory_number  # 将寝室号分配给学生
-            dormitory_number += 1  # 增加下一个寝室号
-        self.students = sorted(self.students, key=lambda x: list(x.values())[0])
+        student_number = np.arange(1, n + 1, dtype=np.int32)
+        interest = self.rng.integers(len(self.interests), size=n, dtype=np.int8)  # 随机选择兴趣爱好
+
+        # 随机打乱学生顺序后按顺序每 dorm_size 人分配一个寝室，结果仍按学号排列
+        order = self.rng.permutation(n)
+        dormitory = np.empty(n, dtype=np.int32)
+        dormitory[order] = np.arange(n, dtype=np.int32) // self.dorm_size + 1
+        self.dormitories = list(range(1, int(dormitory.max(initial=0)) + 1))
+
+        self.students = StudentPopulation(
+            {"student_number": student_number, "dormitory": dormitory, "interest": interest},
+            categories={"interest": self.interests},
+        )
 
     def get_students(self):
         """
@@ -75,4 +146,4 @@ class BaseFreshman:
 if __name__ == '__main__':  # 检验代码
     freshman_group = BaseFreshman(10)  # 生成 10 个新生
     students = freshman_group.get_students()  # 获取新生列表
-    print(students)  # 打印新生列表
+    print(students.to_records())  # 打印新生列表
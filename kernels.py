@@ -0,0 +1,206 @@
+"""此目的在于为逐对更新规则提供可编译（numba）的内核，规则难以向量化时仍能高速运行；
+没有安装 numba（或设置了 SNS_DISABLE_JIT）时退回到结果相同的 NumPy 实现"""
+import os
+
+import numpy as np
+
+try:
+    if os.environ.get('SNS_DISABLE_JIT'):
+        raise ImportError('SNS_DISABLE_JIT')
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 计数器随机数（splitmix64 混合函数）的常量；写成 np.uint64 以免 numba 把无符号与有符号整数的运算提升为浮点数
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_SHIFT30 = np.uint64(30)
+_SHIFT27 = np.uint64(27)
+_SHIFT31 = np.uint64(31)
+_SHIFT32 = np.uint64(32)
+_SHIFT11 = np.uint64(11)
+_STREAMS = np.uint64(4)
+_ONE = np.uint64(1)
+_INV_2_53 = 1.0 / 9007199254740992.0  # 2**-53
+_TWO_PI = 2.0 * np.pi
+
+# 同一学生对在同一天使用的三个独立随机数流
+NORMAL_STREAM_1, NORMAL_STREAM_2, INTEREST_STREAM = 0, 1, 2
+
+
+def _mix(x):
+    """
+    splitmix64 的混合函数：把 64 位整数映射为统计上近似均匀、互不相关的 64 位整数。
+    对标量（numba 内核中）与 uint64 数组（NumPy 实现中）写法相同。
+    """
+    x = (x ^ (x >> _SHIFT30)) * _MIX1
+    x = (x ^ (x >> _SHIFT27)) * _MIX2
+    return x ^ (x >> _SHIFT31)
+
+
+def pair_uniform(key, day, i, j, stream):
+    """
+    计数器随机数：由 (种子键, 天数, 学生对, 流编号) 直接算出 [0, 1) 上的均匀随机数，
+    与遍历顺序、分块方式和线程数无关，因此编译内核与 NumPy 实现得到相同的随机数。
+
+    :param key: uint64 种子键
+    :param day: 天数
+    :param i: 学生下标（标量或 uint64 数组）
+    :param j: 学生下标（标量或 uint64 数组）
+    :param stream: 流编号（见 NORMAL_STREAM_1 等）
+    """
+    counter = _mix(key + _GOLDEN * (np.uint64(day) * _STREAMS + np.uint64(stream) + _ONE))
+    value = _mix(counter ^ ((i << _SHIFT32) | j))
+    return (value >> _SHIFT11) * _INV_2_53
+
+
+def pair_normal(key, day, i, j):
+    """
+    学生对 (i, j) 在第 day 天的标准正态随机数（Box-Muller 变换）。
+    """
+    u1 = 1.0 - pair_uniform(key, day, i, j, NORMAL_STREAM_1)  # (0, 1]，避免 log(0)
+    u2 = pair_uniform(key, day, i, j, NORMAL_STREAM_2)
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(_TWO_PI * u2)
+
+
+def _pair_changes_kernel(matrix, key, day, dormitory, interest, probability):
+    """
+    逐对规则（编译内核）：标准正态波动，前 50 天同寝室翻倍，兴趣相同以 probability 的概率加 0.02；
+    probability < 0 表示不考虑属性。按行并行，第 i 行只写 [i][j] 与 [j][i]（j > i），线程间不冲突。
+    """
+    n = matrix.shape[0]
+    for i in prange(n):
+        ui = np.uint64(i)
+        for j in range(i + 1, n):
+            uj = np.uint64(j)
+            change = pair_normal(key, day, ui, uj)
+            if probability >= 0:
+                if day < 50 and dormitory[i] == dormitory[j]:
+                    change *= 2  # 同寝室关系波动翻倍
+                if interest[i] == interest[j] and pair_uniform(key, day, ui, uj, INTEREST_STREAM) < probability:
+                    change += 0.02
+            matrix[i, j] += change
+            matrix[j, i] += change  # 确保对称性
+
+
+def _pressure_step_kernel(matrix, k, out):
+    """
+    结构压力的三重循环（编译内核）：out[a][b] = clip(R[a][b] + k·Σ_{c≠a,b} R[a][c]·R[c][b], -20, 20)，
+    对角线不做压力传递。按行 a 并行。
+    """
+    n = matrix.shape[0]
+    for a in prange(n):
+        for b in range(n):
+            value = matrix[a, b]
+            if a != b:
+                pressure_sum = 0.0
+                for c in range(n):
+                    if c != a and c != b:
+                        pressure_sum += matrix[a, c] * matrix[c, b]
+                value += k * pressure_sum
+            out[a, b] = min(max(value, -20.0), 20.0)
+
+
+if NUMBA_AVAILABLE:
+    _mix = njit(cache=True)(_mix)
+    pair_uniform = njit(cache=True)(pair_uniform)
+    pair_normal = njit(cache=True)(pair_normal)
+    _pair_changes_kernel = njit(cache=True, parallel=True)(_pair_changes_kernel)
+    _pressure_step_kernel = njit(cache=True, parallel=True)(_pressure_step_kernel)
+
+
+def backend():
+    """
+    返回当前使用的实现：'numba' 或 'numpy'。
+    """
+    return 'numba' if NUMBA_AVAILABLE else 'numpy'
+
+
+def kernel_key(rng):
+    """
+    从 numpy 随机数生成器抽取计数器随机数使用的 uint64 种子键。
+    """
+    return np.uint64(rng.integers(0, 2 ** 63))
+
+
+def pair_changes(key, day, rows, cols, dormitory=None, interest=None, probability=-1.0):
+    """
+    NumPy 实现：按上三角学生对（rows[k] < cols[k]）一次算出当天的全部波动，规则与编译内核相同。
+
+    :return: 与 rows 等长的波动数组
+    """
+    from relationship import apply_pair_rule, pair_attribute_matches
+
+    i, j = rows.astype(np.uint64), cols.astype(np.uint64)
+    with np.errstate(over='ignore'):  # uint64 乘法按 2**64 取模是混合函数的本意
+        change = pair_normal(key, day, i, j)
+        if probability >= 0:
+            apply_pair_rule(change, day, pair_attribute_matches(dormitory, interest, rows, cols), probability,
+                            lambda index: pair_uniform(key, day, i[index], j[index], INTEREST_STREAM))
+    return change
+
+
+def apply_pair_changes(matrix, key, day, dormitory=None, interest=None, probability=None, block_size=1024):
+    """
+    将第 day 天的逐对波动原地加到稠密关系矩阵上。有 numba 时运行编译内核，否则使用 NumPy 实现；
+    NumPy 实现按 block_size 行分块，临时内存为 block_size×n。计数器随机数与分块方式无关，两种实现结果相同。
+
+    :param matrix: n×n 稠密关系矩阵（原地修改）
+    :param key: kernel_key 返回的种子键
+    :param day: 天数
+    :param dormitory: 寝室整数编码（probability 为 None 时不需要）
+    :param interest: 兴趣整数编码
+    :param probability: 兴趣相同加 0.02 的概率，None 表示不考虑属性
+    :param block_size: NumPy 实现每次处理的行数
+    """
+    probability = -1.0 if probability is None else float(probability)
+    if dormitory is None:
+        dormitory = interest = np.zeros(0, dtype=np.int32)
+    if NUMBA_AVAILABLE:
+        _pair_changes_kernel(matrix, key, day, dormitory, interest, probability)
+        return
+    from relationship import add_upper_block
+
+    n = len(matrix)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        rows, cols = np.nonzero(np.arange(n)[None, :] > np.arange(start, stop)[:, None])  # 行块中的上三角
+        block = np.zeros((stop - start, n), dtype=matrix.dtype)
+        block[rows, cols] = pair_changes(key, day, rows + start, cols, dormitory, interest, probability)
+        add_upper_block(matrix, start, block)
+
+
+def pressure_step(matrix, k, out=None):
+    """
+    结构压力传递一步并截断到 [-20, 20]：有 numba 时运行编译的三重循环，
+    否则使用 relationship.blocked_pressure_step 的分块矩阵乘法。
+    编译的三重循环是标量 O(n³) 运算，一般慢于 BLAS 矩阵乘法，只供 StructureRelationship(engine='kernel')
+    显式选用，不是任何模式的默认实现。
+
+    :param matrix: 当前关系矩阵
+    :param k: 压力调节系数
+    :param out: 可选的输出数组（不能与 matrix 相同）
+    :return: 新的关系矩阵
+    """
+    if out is None:
+        out = np.empty_like(matrix)
+    if NUMBA_AVAILABLE:
+        _pressure_step_kernel(matrix, matrix.dtype.type(k), out)
+        return out
+    from relationship import blocked_pressure_step
+
+    return blocked_pressure_step(matrix, k, out=out)
+
+
+if __name__ == '__main__':  # 检验代码：计数器随机数的分布，以及逐对标量写法与数组写法一致
+    key = np.uint64(12345)
+    rows, cols = np.triu_indices(400, 1)
+    normal = pair_changes(key, 3, rows, cols)
+    print(f'{backend()} 后端；正态随机数均值 {normal.mean():.4f}，标准差 {normal.std():.4f}')
+    with np.errstate(over='ignore'):
+        for i, j in ((0, 1), (5, 17), (398, 399)):
+            scalar = pair_normal(key, 3, np.uint64(i), np.uint64(j))
+            assert np.isclose(scalar, normal[np.flatnonzero((rows == i) & (cols == j))[0]])
+    print('标量与数组的计数器随机数一致')
@@ -1,101 +1,353 @@
-from freshman import *
-from relationship import *
-from visualization import *
-from network import *
-import pandas as pd
+import argparse
+import json
+import os
+import time
 
-def InitialModel():
+from export import FORMATS, ResultDataset, new_run_id
+from freshman import BaseFreshman, InitialFreshman
+from network import NetworkAnalysis, convert_to_adjacency_matrix
+from profiling import StageProfiler
+from relationship import BaseRelationship, InitialRelationship, StructureRelationship
+from rng import integer_seed, replica_seeds, replica_streams
+
+# 绘图（matplotlib）与导出（pandas）在需要时才导入，只做模拟的运行不加载它们
+
+# 模型名称 -> (新生类, 关系类, 默认模拟天数, 图片目录, 输出目录)
+MODELS = {
+    'initial': (InitialFreshman, InitialRelationship, 20, './charts/InitialCharts', './output/InitialOutput'),
+    'base': (BaseFreshman, BaseRelationship, 30, './charts/BaseCharts', './output/BaseOutput'),
+    'structure': (BaseFreshman, StructureRelationship, 30, './charts/StructureCharts', './output/StructureOutput'),
+}
+
+# 可选的产出；attribute 需要寝室与兴趣属性，InitialModel 不产出；
+# dataset 把矩阵、中心性与元数据追加到结果数据集（见 export.py），excel 为可选的派生格式，默认不产出；
+# stream 在模拟过程中逐日计算网络指标（见 streaming.py），随 dataset 写入元数据，默认不产出
+OUTPUTS = ('heatmap', 'distribution', 'network', 'centrality_chart', 'attribute', 'dataset', 'excel', 'stream')
+
+DEFAULT_CONFIG = {
+    'model': 'structure',
+    'num_students': 30,
+    'days': None,  # None 表示使用模型的默认天数
+    'k': 0.0015,  # 仅 structure 模型
+    'threshold': 5,
+    'seed': 42,
+    'update_mode': 'loop',
+    'centrality_backend': 'networkx',
+    'outputs': None,  # 产出列表或逗号分隔的字符串（'none' 表示只模拟），None 表示该模型的全部产出
+    'charts_dir': None,  # None 表示该模型的默认目录
+    'output_dir': None,
+    'dataset_dir': './output/dataset',
+    'export_format': 'npz',  # 中心性表格式：'npz' 或 'parquet'（需要 pyarrow）
+    'run_id': None,  # 结果数据集中的运行编号，None 表示自动生成
+    'profile_memory': True,
+}
+
+
+def load_config(path):
     """
-    最基础的模型，新生属性只有编号
+    读取 JSON 配置文件，键与 DEFAULT_CONFIG 相同，未给出的键使用默认值。
     """
-    # InitialModel，模拟新生入学
-    freshman_group = InitialFreshman(30) # 生成 30 个新生
-    students = freshman_group.get_students()  # 获取新生列表
-    # print(students) #输出新生列表
+    with open(path, encoding='utf-8') as file:
+        config = json.load(file)
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"未知的配置项：{sorted(unknown)}")
+    return config
 
-    # 创建 InitialRelationship 实例，模拟新生交互
-    relationships = InitialRelationship(students)
-    relationships.simulate_relationships(days=20) # 模拟 30 天的关系变化
-    relationship_matrix = relationships.get_relationship_matrix() # 获取 30 天后的情绪矩阵
-    # print(relationship_matrix) #输出情绪矩阵
 
-    # 进行可视化
-    plot_heatmap(relationship_matrix,'./charts/InitialCharts')
-    visualize_matrix_distribution(relationship_matrix, './charts/InitialCharts')
+def resolve_config(config=None, **overrides):
+    """
+    合并默认值、配置与覆盖项，并填入与模型相关的默认值（天数、目录、产出）。
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if config['model'] not in MODELS:
+        raise ValueError(f"model 必须是 {tuple(MODELS)} 之一，收到 {config['model']!r}")
+    _, _, days, charts_dir, output_dir = MODELS[config['model']]
+    if config['days'] is None:
+        config['days'] = days
+    if config['charts_dir'] is None:
+        config['charts_dir'] = charts_dir
+    if config['output_dir'] is None:
+        config['output_dir'] = output_dir
+    if config['outputs'] is None:
+        config['outputs'] = [output for output in OUTPUTS if output not in ('excel', 'stream')
+                             and not (output == 'attribute' and config['model'] == 'initial')]
+    elif isinstance(config['outputs'], str):  # 命令行或配置文件中的逗号分隔写法
+        config['outputs'] = [] if config['outputs'].strip() in ('', 'none') else \
+            [item.strip() for item in config['outputs'].split(',')]
+    elif isinstance(config['outputs'], (list, tuple)):
+        config['outputs'] = list(config['outputs'])
+    else:
+        raise TypeError(f"outputs 必须是列表或逗号分隔的字符串，收到 {type(config['outputs']).__name__}")
+    unknown = set(config['outputs']) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"未知的产出：{sorted(unknown)}，可选 {OUTPUTS}")
+    if config['run_id'] is None:
+        config['run_id'] = new_run_id()
+    return config
 
-    # 转化为邻接矩阵进行社会网络分析
-    adjacency_matrix = convert_to_adjacency_matrix(relationship_matrix)
-    visualize_social_network(adjacency_matrix, './charts/InitialCharts')
 
-    # 计算中心性指标
-    centrality_metrics = calculate_centrality(adjacency_matrix)
-    centrality_metrics_df = pd.DataFrame(centrality_metrics)
-    centrality_metrics_df.to_excel('./output/InitialOutput/中心性指标.xlsx', index=False)
-    visualize_network_with_centrality(adjacency_matrix,'./charts/InitialCharts')
+def simulate(config, profiler):
+    """
+    生成新生并模拟关系（流程中的计算部分）。
+    新生类与关系类的 seed 默认都是 None（操作系统熵）；这里的所有随机数流都由 config['seed'] 这一个根种子
+    派生（rng.replica_streams），因此相同配置的结果可以复现。
 
-def BaseModel():
+    :param config: resolve_config 后的配置
+    :param profiler: profiling.StageProfiler
+    :return: (学生, 关系矩阵, 逐日网络指标或 None)
     """
-    最基础的模型，新生属性有(学号，寝室，兴趣爱好)、
+    outputs = set(config['outputs'])
+    freshman_class, relationship_class = MODELS[config['model']][:2]
+
+    # 新生生成、每日波动与流式分析各用由 seed 派生的独立随机数流
+    streams = replica_streams(config['seed'])
+
+    # 创建新生实例，模拟新生入学
+    with profiler.stage('generation'):
+        if freshman_class is InitialFreshman:
+            students = freshman_class(config['num_students']).get_students()
+        else:
+            students = freshman_class(config['num_students'], seed=streams['population']).get_students()
+
+    # 创建关系实例，模拟新生交互
+    with profiler.stage('simulation'):
+        options = {'update_mode': config['update_mode'], 'seed': streams['noise']}
+        if relationship_class is StructureRelationship:
+            options['k'] = config['k']
+        relationships = relationship_class(students, **options)
+        observers = []
+        if 'stream' in outputs:
+            from streaming import NetworkStream
+
+            stream = NetworkStream(threshold=config['threshold'], seed=streams['analysis'])
+            observers.append(stream)
+        relationships.simulate_relationships(days=config['days'], observers=observers)
+        relationship_matrix = relationships.get_relationship_matrix()
+
+    network_metrics = None
+    if 'stream' in outputs:
+        from streaming import METRICS
+
+        network_metrics = {'day': stream.time_series('edges')[0]}
+        network_metrics.update((metric, stream.time_series(metric)[1]) for metric in METRICS)
+    return students, relationship_matrix, network_metrics
+
+
+def write_outputs(config, students, relationship_matrix, profiler, network_metrics=None, timings=None,
+                  layout_cache=None):
     """
-    # 创建BaseFreshman实例，模拟新生入学
-    freshman_group = BaseFreshman(30) # 生成 30 个新生
-    students = freshman_group.get_students()  # 获取新生列表
-    # print(students) #输出新生列表
+    由模拟结果生成所请求的产出（流程中的输出部分）：图表、邻接矩阵与中心性、结果数据集、Excel。
 
-    # 创建 BaseRelationship 实例，模拟新生交互
-    relationships = BaseRelationship(students)
-    relationships.simulate_relationships(days=30) # 模拟 30 天的关系变化
-    relationship_matrix = relationships.get_relationship_matrix() # 获取 30 天后的情绪矩阵
-    # print(relationship_matrix) #输出情绪矩阵
+    :param config: resolve_config 后的配置
+    :param students: 学生
+    :param relationship_matrix: 最终关系矩阵
+    :param profiler: profiling.StageProfiler
+    :param network_metrics: simulate 返回的逐日网络指标
+    :param timings: 写入数据集元数据时并入的其他阶段耗时（在其他进程中输出时为模拟阶段的耗时）
+    :param layout_cache: 本次运行的 layout.LayoutCache，默认新建（布局不受同一进程中其他运行的影响）
+    :return: NetworkAnalysis，没有需要网络分析的产出时为 None
+    """
+    outputs = set(config['outputs'])
+    charts_dir, output_dir = config['charts_dir'], config['output_dir']
 
     # 进行可视化
-    plot_heatmap(relationship_matrix,'./charts/BaseCharts')
-    visualize_matrix_distribution(relationship_matrix, './charts/BaseCharts')
+    if outputs & {'heatmap', 'distribution'}:
+        os.makedirs(charts_dir, exist_ok=True)
+        with profiler.stage('charts'):
+            from visualization import plot_heatmap, visualize_matrix_distribution
 
-    # 转化为邻接矩阵进行社会网络分析
-    adjacency_matrix = convert_to_adjacency_matrix(relationship_matrix)
-    visualize_social_network(adjacency_matrix, './charts/BaseCharts')
+            if 'heatmap' in outputs:
+                plot_heatmap(relationship_matrix, charts_dir)
+            if 'distribution' in outputs:
+                visualize_matrix_distribution(relationship_matrix, charts_dir)
 
-    # 计算中心性指标
-    centrality_metrics = calculate_centrality(adjacency_matrix)
-    centrality_metrics_df = pd.DataFrame(centrality_metrics)
-    centrality_metrics_df.to_excel('./output/BaseOutput/中心性指标.xlsx', index=False)
-    visualize_network_with_centrality(adjacency_matrix, './charts/BaseCharts')
+    analysis = None
+    if outputs & {'network', 'centrality_chart', 'attribute', 'dataset', 'excel'}:
+        # 转化为邻接矩阵进行社会网络分析
+        with profiler.stage('adjacency'):
+            adjacency_matrix = convert_to_adjacency_matrix(relationship_matrix, threshold=config['threshold'])
+            analysis = NetworkAnalysis(adjacency_matrix, centrality_backend=config['centrality_backend'],
+                                       layout_cache=layout_cache)
+
+        # 计算中心性指标
+        if outputs & {'centrality_chart', 'dataset', 'excel'}:
+            with profiler.stage('centrality'):
+                centrality_metrics = analysis.centrality
+
+        if outputs & {'network', 'centrality_chart', 'attribute'}:
+            os.makedirs(charts_dir, exist_ok=True)
+            with profiler.stage('charts'):
+                from visualization import (visualize_network_with_centrality, visualize_social_network,
+                                           visualize_social_network_attribute)
+
+                if 'network' in outputs:
+                    visualize_social_network(analysis, charts_dir)
+                if 'centrality_chart' in outputs:
+                    visualize_network_with_centrality(analysis, charts_dir)
+                if 'attribute' in outputs:
+                    # 观察属性和小世界的关系
+                    visualize_social_network_attribute(analysis, students, charts_dir)
+
+        if outputs & {'dataset', 'excel'}:
+            with profiler.stage('export'):
+                if 'dataset' in outputs:
+                    dataset = ResultDataset(config['dataset_dir'], format=config['export_format'])
+                    metadata = {'config': config, 'timings': dict(timings or {}, **profiler.as_dict())}
+                    if network_metrics is not None:
+                        metadata['network_metrics'] = network_metrics
+                    dataset.write_run(config['model'], relationship_matrix, centrality_metrics, metadata,
+                                      run_id=config['run_id'])
+                if 'excel' in outputs:
+                    import pandas as pd
+
+                    os.makedirs(output_dir, exist_ok=True)
+                    pd.DataFrame(centrality_metrics).to_excel(f'{output_dir}/中心性指标.xlsx', index=False)
+    return analysis
+
+
+def render_outputs(config, students, relationship_matrix, network_metrics=None, timings=None):
+    """
+    在输出进程中调用的 write_outputs：使用新的 StageProfiler，返回各输出阶段的耗时。
+    """
+    profiler = StageProfiler(trace_memory=config['profile_memory'])
+    write_outputs(config, students, relationship_matrix, profiler, network_metrics, timings)
+    return profiler.as_dict()
+
+
+def run_pipeline(config=None, profiler=None, output_stage=None):
+    """
+    按配置运行一次完整流程：生成新生、模拟关系、转换邻接矩阵、计算中心性、绘图、导出。
+    只执行所请求的产出需要的阶段；各阶段的耗时与峰值内存记录在 profiler 中。
+
+    :param config: 配置字典，见 DEFAULT_CONFIG
+    :param profiler: profiling.StageProfiler，默认新建
+    :param output_stage: 可选的 outputs.OutputStage；给出时产出交给后台输出进程，本函数模拟完成即返回，
+                         可以紧接着开始下一次模拟（产出全部完成需调用 output_stage.flush()）
+    :return: (关系矩阵, NetworkAnalysis 或 None, profiler)；交给后台输出时 NetworkAnalysis 为 None
+    """
+    config = resolve_config(config)
+    profiler = profiler or StageProfiler(trace_memory=config['profile_memory'])
+    students, relationship_matrix, network_metrics = simulate(config, profiler)
+    if output_stage is not None:
+        if set(config['outputs']) - {'stream'}:
+            with profiler.stage('queue'):  # 输出队列已满时在此等待（背压）
+                output_stage.submit(render_outputs, config, students, relationship_matrix, network_metrics,
+                                    profiler.as_dict())
+        return relationship_matrix, None, profiler
+    from layout import LayoutCache
+
+    # 布局缓存只在本次运行内共享，同一进程中先后运行的流程互不影响
+    analysis = write_outputs(config, students, relationship_matrix, profiler, network_metrics,
+                             layout_cache=LayoutCache())
+    return relationship_matrix, analysis, profiler
+
+
+def run_batch(configs, output_workers=2, max_pending=None):
+    """
+    依次运行多次流程（如参数扫描或多个种子）：模拟在当前进程中进行，图表与导出交给后台输出进程池，
+    与下一次模拟重叠执行；输出积压达到 max_pending 时暂停模拟，内存不会随运行次数增长。
+
+    :param configs: 配置字典列表
+    :param output_workers: 输出进程数；0 表示不使用后台输出，逐次串行完成
+    :param max_pending: 同时在途的输出任务上限，默认 2×output_workers
+    :return: [(配置, profiler)]，profiler 只含模拟部分（及等待输出队列）的阶段
+    """
+    from outputs import OutputStage
+
+    configs = [resolve_config(config) for config in configs]
+    results = []
+    if output_workers == 0:
+        for config in configs:
+            results.append((config, run_pipeline(config)[2]))
+        return results
+    with OutputStage(workers=output_workers, max_pending=max_pending) as output_stage:
+        for config in configs:
+            results.append((config, run_pipeline(config, output_stage=output_stage)[2]))
+    return results
+
+
+def InitialModel():
+    """
+    最基础的模型，新生属性只有编号
+    """
+    return run_pipeline({'model': 'initial'})
+
+
+def BaseModel():
+    """
+    最基础的模型，新生属性有(学号，寝室，兴趣爱好)、
+    """
+    return run_pipeline({'model': 'base'})
 
-    # 观察属性和小世界的关系
-    visualize_social_network_attribute(adjacency_matrix, students, './charts/BaseCharts')
 
 def StructureModel():
     """
     增加结构平衡的模型，新生属性有(学号，寝室，兴趣爱好)，并使用压力传递算法来
     模拟小团体的加剧现象
     """
-    # 创建BaseFreshman实例，模拟新生入学（这里仍然可以使用创建BaseFreshman实例）
-    freshman_group = BaseFreshman(30) # 生成 30 个新生
-    students = freshman_group.get_students()  # 获取新生列表
-    # print(students) #输出新生列表
+    return run_pipeline({'model': 'structure'})
 
-    # 创建 StructureRelationship 实例，模拟结构平衡
-    relationships = StructureRelationship(students)
-    relationships.simulate_relationships(days=30) # 模拟 30 天的关系变化
-    relationship_matrix = relationships.get_relationship_matrix() # 获取 30 天后的情绪矩阵
-    # print(relationship_matrix) #输出情绪矩阵
 
-    # 进行可视化
-    plot_heatmap(relationship_matrix,'./charts/StructureCharts')
-    visualize_matrix_distribution(relationship_matrix, './charts/StructureCharts')
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='新生社会网络模拟')
+    parser.add_argument('--config', help='JSON 配置文件，命令行参数优先')
+    parser.add_argument('--model', choices=tuple(MODELS))
+    parser.add_argument('--students', dest='num_students', type=int, help='新生人数')
+    parser.add_argument('--days', type=int, help='模拟天数')
+    parser.add_argument('--k', type=float, help='结构压力系数（structure 模型）')
+    parser.add_argument('--threshold', type=float, help='邻接矩阵阈值')
+    parser.add_argument('--seed', type=int, help='随机数种子')
+    parser.add_argument('--update-mode', choices=StructureRelationship.update_modes)
+    parser.add_argument('--centrality-backend', choices=('networkx', 'matrix'))
+    parser.add_argument('--outputs', help=f'逗号分隔的产出，可选 {",".join(OUTPUTS)}；none 表示只模拟')
+    parser.add_argument('--charts-dir')
+    parser.add_argument('--output-dir', help='excel 产出的目录')
+    parser.add_argument('--dataset-dir', help='结果数据集根目录')
+    parser.add_argument('--export-format', choices=FORMATS)
+    parser.add_argument('--no-memory', dest='profile_memory', action='store_false', default=None,
+                        help='不统计峰值内存（tracemalloc 会拖慢图计算）')
+    parser.add_argument('--runs', type=int, default=1,
+                        help='连续运行的次数，第 i 次的种子由 seed 派生（rng.replica_seeds），图表写入各自的 run 子目录')
+    parser.add_argument('--output-workers', type=int, default=0,
+                        help='后台输出进程数，出图与导出与下一次模拟重叠执行；0 表示串行')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = vars(parse_args(argv))
+    config_path = args.pop('config')
+    config = load_config(config_path) if config_path else {}
+    runs, output_workers = args.pop('runs'), args.pop('output_workers')
+    config = resolve_config(config, **args)
+    if runs == 1 and output_workers == 0:
+        _, _, profiler = run_pipeline(config)
+        print(profiler.report())
+        if 'dataset' in config['outputs']:
+            print(f"结果已写入 {config['dataset_dir']}（model={config['model']}, run={config['run_id']}）")
+        return
 
-    # 转化为邻接矩阵进行社会网络分析
-    adjacency_matrix = convert_to_adjacency_matrix(relationship_matrix)
-    visualize_social_network(adjacency_matrix, './charts/StructureCharts')
+    configs = []
+    # 第 i 次运行的种子由根种子派生（rng.replica_seeds），相邻运行的随机数流互不重叠；
+    # 写成整数以便记入元数据，用 --seed 传入该整数即可单独复现这次运行
+    seeds = [integer_seed(seed) for seed in replica_seeds(config['seed'], runs)] if runs > 1 else [config['seed']]
+    for index in range(runs):
+        run_config = dict(config, seed=seeds[index], run_id=None if runs > 1 else config['run_id'])
+        run_config = resolve_config(run_config)
+        if runs > 1:  # 每次运行的图表与 Excel 写入各自的子目录，互不覆盖
+            run_config['charts_dir'] = os.path.join(config['charts_dir'], f"run={run_config['run_id']}")
+            run_config['output_dir'] = os.path.join(config['output_dir'], f"run={run_config['run_id']}")
+        configs.append(run_config)
+    start = time.perf_counter()
+    results = run_batch(configs, output_workers=output_workers)
+    elapsed = time.perf_counter() - start
+    busy = sum(profiler.total() for _, profiler in results)
+    queue = sum(profiler.as_dict().get('queue', {}).get('seconds', 0.0) for _, profiler in results)
+    print(f'{runs} 次运行共 {elapsed:.3f} s（主进程各阶段 {busy - queue:.3f} s，等待输出队列 {queue:.3f} s）')
+    if 'dataset' in config['outputs']:
+        print(f"结果已写入 {config['dataset_dir']}（model={config['model']}）")
 
-    # 计算中心性指标
-    centrality_metrics = calculate_centrality(adjacency_matrix)
-    centrality_metrics_df = pd.DataFrame(centrality_metrics)
-    centrality_metrics_df.to_excel('./output/StructureOutput/中心性指标.xlsx', index=False)
-    visualize_network_with_centrality(adjacency_matrix, './charts/StructureCharts')
 
-    # 观察属性和小世界的关系
-    visualize_social_network_attribute(adjacency_matrix, students, './charts/StructureCharts')
 if __name__ == '__main__':
-    StructureModel()
\ No newline at end of file
+    main()
@@ -1,8 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
-# 设置全局字体
-plt.rcParams['font.family'] = 'SimHei'  # 黑体
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 
 def plot_normal_distribution(mu=0, sigma=1, size=1000):
     """
@@ -12,6 +8,12 @@ def plot_normal_distribution(mu=0, sigma=1, size=1000):
     :param sigma: 正态分布的标准差，默认为 1。
     :param size: 随机生成的样本数，默认为 1000。
     """
+    import matplotlib.pyplot as plt
+
+    # 设置全局字体
+    plt.rcParams['font.family'] = 'SimHei'  # 黑体
+    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+
     # 生成正态分布的随机数据
     data = np.random.normal(loc=mu, scale=sigma, size=size)
 
@@ -34,5 +36,5 @@ def plot_normal_distribution(mu=0, sigma=1, size=1000):
     plt.show()
 
 
-# 调用函数
-plot_normal_distribution(mu=0, sigma=1, size=1000)
+if __name__ == '__main__':  # 只在直接运行时绘图，导入本模块不会产生副作用
+    plot_normal_distribution(mu=0, sigma=1, size=1000)
@@ -0,0 +1,102 @@
+"""此目的在于把出图与导出放到后台进程池中执行，与下一次模拟重叠；有界队列提供背压，内存不随任务数增长"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import os
+import time
+import traceback
+
+
+def _headless():
+    """
+    输出进程的初始化函数：只保存图片，不需要图形界面。
+    """
+    os.environ['SNS_HEADLESS'] = '1'
+
+
+def _run_task(function, args, kwargs):
+    """
+    在输出进程中执行任务；异常转为只含回溯文本的 RuntimeError，避免无法序列化的异常
+    （如 networkx 的收敛异常）在传回主进程时出错。
+    """
+    try:
+        return function(*args, **kwargs)
+    except Exception:
+        raise RuntimeError(f'输出任务 {function.__name__} 失败：\n{traceback.format_exc()}') from None
+
+
+class OutputStage:
+    """
+    后台输出阶段：submit 把任务（如 main.render_outputs）交给进程池后立即返回；
+    在途任务达到 max_pending 时 submit 会等待最早完成的任务（背压），因此同时保存在内存中的
+    关系矩阵最多 max_pending 份。flush 等待全部任务完成，任务中的异常在 submit 或 flush 时重新抛出。
+
+        with OutputStage(workers=2) as output_stage:
+            for config in configs:
+                run_pipeline(config, output_stage=output_stage)
+        # 退出 with 块时已全部输出
+
+    """
+
+    def __init__(self, workers=2, max_pending=None, executor='process'):
+        """
+        :param workers: 输出进程（线程）数
+        :param max_pending: 同时在途的任务上限，默认 2×workers
+        :param executor: 'process'（默认，matplotlib 不是线程安全的）或 'thread'（仅用于不出图的导出）
+        """
+        if executor not in ('process', 'thread'):
+            raise ValueError(f"executor 必须是 'process' 或 'thread'，收到 {executor!r}")
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        if executor == 'process':
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_headless)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = set()
+        self.results = []  # 已完成任务的返回值，按完成顺序
+        self.submitted = 0
+        self.blocked_seconds = 0.0  # 因背压等待的总时间；接近 0 说明吞吐受计算而不是输出限制
+
+    def submit(self, function, *args, **kwargs):
+        """
+        提交一个输出任务；队列已满时先等待至少一个任务完成。
+        :param function: 可在输出进程中调用的模块级函数
+        """
+        if len(self.pending) >= self.max_pending:
+            start = time.perf_counter()
+            while len(self.pending) >= self.max_pending:
+                self._collect(wait(self.pending, return_when=FIRST_COMPLETED)[0])
+            self.blocked_seconds += time.perf_counter() - start
+        self.pending.add(self.pool.submit(_run_task, function, args, kwargs))
+        self.submitted += 1
+
+    def flush(self):
+        """
+        等待全部在途任务完成。
+        :return: 所有已完成任务的返回值
+        """
+        while self.pending:
+            self._collect(wait(self.pending, return_when=FIRST_COMPLETED)[0])
+        return self.results
+
+    def close(self):
+        """
+        等待全部任务完成并关闭进程池。
+        """
+        try:
+            self.flush()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    def _collect(self, done):
+        for future in done:
+            self.pending.discard(future)
+            self.results.append(future.result())  # 任务出错时在这里重新抛出
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:  # 已经在出错，不再等待其余输出
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        return False
@@ -0,0 +1,101 @@
+"""此目的在于统计运行流程中各阶段的耗时与峰值内存，便于定位时间花在哪里"""
+from contextlib import contextmanager
+import sys
+import time
+import tracemalloc
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def max_rss():
+    """
+    返回本进程的常驻内存峰值（字节），平台不支持时返回 None。
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # Linux 以 KB 为单位
+
+
+class StageProfiler:
+    """
+    按阶段记录耗时与峰值内存：
+
+        profiler = StageProfiler()
+        with profiler.stage('simulation'):
+            ...
+        print(profiler.report())
+
+    峰值内存由 tracemalloc 统计（NumPy 数组的分配也计入），为该阶段内相对于阶段开始时的增量峰值。
+    tracemalloc 会让大量小对象的分配（如 networkx 图）变慢，trace_memory=False 时只计时。
+    """
+
+    def __init__(self, trace_memory=True):
+        """
+        :param trace_memory: 是否统计各阶段峰值内存
+        """
+        self.trace_memory = trace_memory
+        self.records = []  # [(阶段名, 秒, 峰值内存字节数或 None)]
+
+    @contextmanager
+    def stage(self, name):
+        """
+        统计 with 块内的耗时与峰值内存，结果追加到 records。
+        """
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+            self.records.append((name, elapsed, peak))
+
+    def total(self):
+        """
+        所有阶段的总耗时（秒）。
+        """
+        return sum(elapsed for _, elapsed, _ in self.records)
+
+    def as_dict(self):
+        """
+        返回 {阶段名: {'seconds': 秒, 'peak_bytes': 峰值内存}}，同名阶段累加耗时、取最大峰值。
+        """
+        result = {}
+        for name, elapsed, peak in self.records:
+            entry = result.setdefault(name, {'seconds': 0.0, 'peak_bytes': None})
+            entry['seconds'] += elapsed
+            if peak is not None:
+                entry['peak_bytes'] = max(peak, entry['peak_bytes'] or 0)
+        return result
+
+    def report(self):
+        """
+        返回各阶段耗时与峰值内存的文本表格。
+        """
+        lines = [f'{"阶段":<14}{"耗时(s)":>10}{"峰值内存":>14}']
+        for name, entry in self.as_dict().items():
+            peak = '-' if entry['peak_bytes'] is None else _format_bytes(entry['peak_bytes'])
+            lines.append(f'{name:<14}{entry["seconds"]:>10.3f}{peak:>14}')
+        lines.append(f'{"total":<14}{self.total():>10.3f}')
+        rss = max_rss()
+        if rss is not None:
+            lines.append(f'进程常驻内存峰值：{_format_bytes(rss)}')
+        return '\n'.join(lines)
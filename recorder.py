@@ -0,0 +1,236 @@
+"""此目的在于逐日记录关系矩阵的演化轨迹，数据直接写入内存映射文件，内存占用与记录天数无关"""
+import json
+import os
+
+import numpy as np
+
+SUMMARY_COLUMNS = ['mean', 'std', 'min', 'max', 'positive_fraction', 'above_threshold_fraction']
+
+
+def upper_triangle_position(i, j, num_students):
+    """
+    学生对 (i, j)（i < j，可以是数组）在上三角按行展开后的位置。
+    """
+    return i * num_students - i * (i + 1) // 2 + (j - i - 1)
+
+
+def write_upper_triangle(matrix, out):
+    """
+    将矩阵上三角（不含对角线）按行展开写入 out。稠密矩阵逐行切片复制，不需要 n² 大小的下标数组；
+    稀疏矩阵只散射非零元素，不转为稠密矩阵。
+
+    :param matrix: 稠密或 scipy.sparse 关系矩阵
+    :param out: 长度为 n(n-1)/2 的一维数组（可以是内存映射）
+    """
+    if not isinstance(matrix, np.ndarray):
+        rows, cols, values = _upper_entries(matrix)
+        out[:] = 0
+        out[upper_triangle_position(rows, cols, matrix.shape[0])] = values
+        return
+    offset = 0
+    for i in range(len(matrix) - 1):
+        length = len(matrix) - i - 1
+        out[offset:offset + length] = matrix[i, i + 1:]
+        offset += length
+
+
+def _upper_entries(matrix):
+    """
+    稀疏矩阵上三角（不含对角线）的非零元素：(行下标, 列下标, 值)。
+    """
+    import scipy.sparse as sp
+
+    upper = sp.triu(matrix, 1, format='coo')
+    return upper.row.astype(np.int64), upper.col.astype(np.int64), upper.data
+
+
+def summarize_matrix(matrix, threshold, buffer=None):
+    """
+    计算所有学生对（对称矩阵的上三角，不含对角线）的汇总统计量，顺序见 SUMMARY_COLUMNS。
+    稀疏矩阵只用非零元素与隐含的 0 的个数计算，不转为稠密矩阵。
+
+    :param matrix: 稠密或 scipy.sparse 关系矩阵
+    :param threshold: 统计“超过阈值”比例时使用的阈值
+    :param buffer: 可选的长度为 n(n-1)/2 的数组，稠密矩阵的上三角复制到这里，多次调用时可重复使用
+    """
+    n = matrix.shape[0]
+    total = n * (n - 1) // 2
+    if total == 0:
+        return np.zeros(len(SUMMARY_COLUMNS))
+    if isinstance(matrix, np.ndarray):
+        values = np.empty(total, dtype=matrix.dtype) if buffer is None else buffer
+        write_upper_triangle(matrix, values)
+        return np.array([values.mean(), values.std(), values.min(), values.max(),
+                         np.mean(values > 0), np.mean(values > threshold)])
+    values = _upper_entries(matrix)[2].astype(np.float64)
+    zeros = total - len(values)  # 没有存储的学生对，关系为 0
+    mean = values.sum() / total
+    variance = (np.sum((values - mean) ** 2) + zeros * mean ** 2) / total
+    low = min(values.min(), 0) if zeros else values.min()
+    high = max(values.max(), 0) if zeros else values.max()
+    above = np.count_nonzero(values > threshold) + (zeros if threshold < 0 else 0)
+    return np.array([mean, np.sqrt(variance), low, high, np.count_nonzero(values > 0) / total, above / total])
+
+
+class TrajectoryRecorder:
+    """
+    作为 simulate_relationships 的观察者（observers 参数）使用，每 every 天记录一次快照。
+    mode='full' 记录完整矩阵，'upper' 只记录上三角（约一半空间），'summary' 只记录汇总统计量，
+    'pairs' 只记录 pairs 中指定学生对的关系（供 Trajectory.pair_series 使用）。
+    快照写入预先分配的 .npy 内存映射文件，读取时用 load_trajectory 按需切片。
+    稀疏关系矩阵不会被转为稠密矩阵：各模式都只读取非零元素或指定的学生对。
+    """
+    modes = ('full', 'upper', 'summary', 'pairs')
+
+    def __init__(self, directory, num_students, days, mode='upper', every=1, dtype=np.float32, threshold=5,
+                 pairs=None):
+        """
+        :param directory: 轨迹保存目录
+        :param num_students: 学生数量
+        :param days: 计划模拟的天数，用于预分配文件大小
+        :param mode: 'full'、'upper'、'summary' 或 'pairs'
+        :param every: 每隔多少天记录一次（降采样）
+        :param dtype: 快照的数据类型（默认 float32，减半磁盘占用）
+        :param threshold: summary 模式下统计“超过阈值”比例的阈值
+        :param pairs: pairs 模式下需要记录的学生对列表，如 [(0, 1), (2, 5)]（下标从 0 开始）
+        """
+        if mode not in self.modes:
+            raise ValueError(f"mode 必须是 {self.modes} 之一，收到 {mode!r}")
+        if (mode == 'pairs') != (pairs is not None):
+            raise ValueError("pairs 参数只用于且必须用于 mode='pairs'")
+        self.directory = directory
+        self.num_students = num_students
+        self.mode = mode
+        self.every = every
+        self.threshold = threshold
+        self.count = 0  # 已记录的快照数
+        self.pairs = None if pairs is None else np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        self._buffer = None  # summary 模式下复用的上三角缓冲
+        os.makedirs(directory, exist_ok=True)
+
+        capacity = days // every
+        if mode == 'full':
+            shape = (capacity, num_students, num_students)
+        elif mode == 'upper':
+            shape = (capacity, num_students * (num_students - 1) // 2)
+        elif mode == 'pairs':
+            shape = (capacity, len(self.pairs))
+        else:
+            shape = (capacity, len(SUMMARY_COLUMNS))
+            dtype = np.float64
+        self.data = np.lib.format.open_memmap(os.path.join(directory, 'trajectory.npy'), mode='w+',
+                                              dtype=dtype, shape=shape)
+        self.days = np.lib.format.open_memmap(os.path.join(directory, 'days.npy'), mode='w+',
+                                              dtype=np.int64, shape=(capacity,))
+        self._write_meta()
+
+    def observe(self, day, matrix):
+        """
+        模拟完成第 day 天后调用；只在 day 为 every 的倍数时记录。
+        :param day: 已完成的天数
+        :param matrix: 当前关系矩阵（稠密或 scipy.sparse）
+        """
+        if day % self.every != 0 or self.count >= len(self.data):
+            return
+        if self.mode == 'full':
+            if isinstance(matrix, np.ndarray):
+                self.data[self.count] = matrix
+            else:
+                coo = matrix.tocoo()
+                self.data[self.count] = 0
+                self.data[self.count][coo.row, coo.col] = coo.data
+        elif self.mode == 'upper':
+            write_upper_triangle(matrix, self.data[self.count])
+        elif self.mode == 'pairs':
+            values = matrix[self.pairs[:, 0], self.pairs[:, 1]]  # 稀疏矩阵只取出这些学生对
+            self.data[self.count] = np.asarray(values).ravel()
+        else:
+            if isinstance(matrix, np.ndarray) and (self._buffer is None or self._buffer.dtype != matrix.dtype):
+                self._buffer = np.empty(self.num_students * (self.num_students - 1) // 2, dtype=matrix.dtype)
+            self.data[self.count] = summarize_matrix(matrix, self.threshold, self._buffer)  # 稀疏矩阵不用缓冲
+        self.days[self.count] = day
+        self.count += 1
+        self._write_meta()  # 元数据很小，每次更新后即使中途崩溃也能读取已记录的部分
+
+    def close(self):
+        """
+        将缓冲写回磁盘并更新元数据。
+        """
+        self.data.flush()
+        self.days.flush()
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {'mode': self.mode, 'num_students': self.num_students, 'every': self.every,
+                'count': self.count, 'threshold': self.threshold}
+        if self.pairs is not None:
+            meta['pairs'] = self.pairs.tolist()
+        with open(os.path.join(self.directory, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+
+class Trajectory:
+    """
+    只读的轨迹视图：数据保持在磁盘上（内存映射），按需读取切片。
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as file:
+            self.meta = json.load(file)
+        count = self.meta['count']
+        self.mode = self.meta['mode']
+        self.num_students = self.meta['num_students']
+        self.data = np.load(os.path.join(directory, 'trajectory.npy'), mmap_mode='r')[:count]
+        self.days = np.load(os.path.join(directory, 'days.npy'), mmap_mode='r')[:count]
+
+    def __len__(self):
+        return len(self.days)
+
+    def snapshot(self, index):
+        """
+        返回第 index 个快照的完整关系矩阵（summary 模式返回汇总统计量，pairs 模式返回 {学生对: 关系}）。
+        """
+        if self.mode == 'full':
+            return np.asarray(self.data[index])
+        if self.mode == 'summary':
+            return dict(zip(SUMMARY_COLUMNS, self.data[index]))
+        if self.mode == 'pairs':
+            return dict(zip(map(tuple, self.meta['pairs']), self.data[index]))
+        matrix = np.zeros((self.num_students, self.num_students), dtype=self.data.dtype)
+        rows, cols = np.triu_indices(self.num_students, 1)
+        matrix[rows, cols] = self.data[index]
+        matrix[cols, rows] = self.data[index]
+        return matrix
+
+    def pair_series(self, i, j):
+        """
+        返回学生 i 与 j（从 0 开始）之间关系随时间的序列。
+        """
+        if self.mode == 'summary':
+            raise ValueError("summary 模式没有记录学生对的关系")
+        if self.mode == 'full':
+            return np.asarray(self.data[:, i, j])
+        if self.mode == 'pairs':
+            for position, pair in enumerate(self.meta['pairs']):
+                if sorted(pair) == sorted((i, j)):  # 关系矩阵对称，(i, j) 与 (j, i) 相同
+                    return np.asarray(self.data[:, position])
+            raise ValueError(f"学生对 ({i}, {j}) 没有被记录")
+        if i == j:
+            return np.zeros(len(self), dtype=self.data.dtype)
+        i, j = min(i, j), max(i, j)
+        return np.asarray(self.data[:, upper_triangle_position(i, j, self.num_students)])
+
+    def summary_series(self, column):
+        """
+        返回 summary 模式下某个统计量随时间的序列。
+        """
+        if self.mode != 'summary':
+            raise ValueError("只有 summary 模式记录了汇总统计量")
+        return np.asarray(self.data[:, SUMMARY_COLUMNS.index(column)])
+
+
+def load_trajectory(directory):
+    """
+    打开 TrajectoryRecorder 保存的轨迹，返回 Trajectory 只读视图。
+    """
+    return Trajectory(directory)
@@ -1,85 +1,505 @@
 # 该文档目的在于模拟现实生活中各种关系，由简单到复杂逐步进行
 
-import random
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import json
 import numpy as np
-random.seed(42)
 
-class InitialRelationship:
-    def __init__(self, students):
+from rng import integer_seed, python_random, spawn
+
+
+def structure_pressure(matrix, k):
+    """
+    以矩阵乘法计算结构压力：pressure[a][b] = k * Σ_{c≠a,b} R[a][c] * R[c][b]。
+    先用 R@R（走 BLAS）求出全部 c 的和，再减去 c==a 与 c==b 两项，对角线不参与传递。
+
+    :param matrix: 当前关系矩阵（n×n，float32 或 float64）
+    :param k: 压力调节系数
+    :return: 与 matrix 同 dtype 的压力矩阵
+    """
+    diag = np.diagonal(matrix)
+    pressure = matrix @ matrix
+    pressure -= matrix * (diag[:, None] + diag[None, :])  # 去掉 c==a 与 c==b 两项
+    pressure *= k
+    np.fill_diagonal(pressure, 0)  # a==b 时不做压力传递
+    return pressure
+
+
+def blocked_pressure_step(matrix, k, out=None, block_size=1024, workers=None):
+    """
+    结构压力传递一步：out = clip(R + structure_pressure(R, k), -20, 20)，按 block_size 行分块
+    直接写入预先分配的 out，截断也在原地完成。除 out 外只需要 block_size×n 的临时内存，
+    峰值内存约为两个矩阵（当前矩阵与 out，即双缓冲）。各行块互不依赖，
+    workers > 1 时用线程池并行（矩阵乘法释放 GIL）；否则串行，由多线程 BLAS 负责并行。
+
+    :param matrix: 当前关系矩阵（n×n，float32 或 float64）
+    :param k: 压力调节系数
+    :param out: 输出数组（与 matrix 同形状、同 dtype，不能与 matrix 相同），None 时新分配
+    :param block_size: 每块的行数
+    :param workers: 线程数，None 或 1 表示串行
+    :return: out
+    """
+    n = len(matrix)
+    if out is None:
+        out = np.empty_like(matrix)
+    diag = np.diagonal(matrix)
+    has_diag = diag.any()  # 模拟中对角线始终为 0，此时不需要减去 c==a、c==b 两项
+
+    def update(start):
+        stop = min(start + block_size, n)
+        block = out[start:stop]
+        np.matmul(matrix[start:stop], matrix, out=block)
+        if has_diag:
+            block -= matrix[start:stop] * (diag[start:stop, None] + diag[None, :])  # 去掉 c==a 与 c==b 两项
+        block *= k
+        block[np.arange(stop - start), np.arange(start, stop)] = 0  # a==b 时不做压力传递
+        block += matrix[start:stop]
+        np.clip(block, -20, 20, out=block)
+
+    starts = range(0, n, block_size)
+    if workers is not None and workers > 1 and n > block_size:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(update, starts))
+    else:
+        for start in starts:
+            update(start)
+    return out
+
+
+def loop_structure_pressure(matrix, k):
+    """
+    原始的三重循环实现，保留用于小规模下与 structure_pressure 做一致性校验。
+
+    :param matrix: 当前关系矩阵
+    :param k: 压力调节系数
+    :return: 压力矩阵
+    """
+    num_students = len(matrix)
+    pressure = np.zeros_like(matrix)
+    for a in range(num_students):
+        for b in range(num_students):
+            if a != b:
+                pressure_sum = 0  # 初始化压力
+                for c in range(num_students):
+                    if c != a and c != b:  # 排除自身和目标
+                        pressure_sum += k * matrix[a][c] * matrix[c][b]
+                pressure[a][b] = pressure_sum
+    return pressure
+
+
+def sparse_structure_pressure(matrix, k):
+    """
+    structure_pressure 的稀疏版本：对 CSR 关系矩阵做稀疏矩阵乘法，结果仍为 CSR，对角线为 0。
+
+    :param matrix: scipy.sparse 关系矩阵
+    :param k: 压力调节系数
+    :return: CSR 压力矩阵
+    """
+    import scipy.sparse as sp
+
+    diag = matrix.diagonal()
+    pressure = (matrix @ matrix).tocsr()
+    if diag.any():  # 去掉 c==a 与 c==b 两项（稀疏模式下对角线通常不存储）
+        pressure = pressure - sp.csr_matrix(matrix.multiply(diag[:, None] + diag[None, :]))
+    pressure = pressure - sp.diags(pressure.diagonal())  # a==b 时不做压力传递
+    pressure = pressure * k
+    pressure.eliminate_zeros()
+    return pressure.tocsr()
+
+
+def add_upper_block(matrix, start, block):
+    """
+    将第 start 行起的一个行块的上三角波动对称地加到稠密关系矩阵上：matrix[行块] += block，
+    matrix[:, 行块] += block.T。block 中 j <= i 的位置必须为 0，按行块处理时不需要 n² 长的学生对下标。
+
+    :param matrix: n×n 稠密关系矩阵（原地修改）
+    :param start: 行块的起始行
+    :param block: (行数, n) 的波动，只有上三角（j > i）非零
+    """
+    stop = start + len(block)
+    matrix[start:stop] += block
+    matrix[:, start:stop] += block.T
+
+
+def encode_attributes(students, keys):
+    """
+    将学生的类别属性编码为紧凑的整数数组，每个属性只遍历一次学生列表。
+
+    :param students: 学生列表，每个学生是一个字典；也可以是列式的 StudentPopulation
+    :param keys: 需要编码的属性名，例如 ('dormitory', 'interest')
+    :return: {属性名: (int32 编码数组, 编码对应的原始取值列表)}
+    """
+    encoded = {}
+    if hasattr(students, 'codes'):  # 列式群体：直接使用已有的编码列
+        for key in keys:
+            codes = students.codes(key).astype(np.int32, copy=False)
+            encoded[key] = (codes, students.categories.get(key, list(np.unique(students.columns[key]))))
+        return encoded
+    for key in keys:
+        mapping = {}  # 原始取值 -> 编码
+        codes = np.fromiter((mapping.setdefault(student[key], len(mapping)) for student in students),
+                            dtype=np.int32, count=len(students))
+        encoded[key] = (codes, list(mapping))
+    return encoded
+
+
+def pair_attribute_matches(dormitory, interest, rows, cols, mask=None):
+    """
+    计算学生对是否同寝室、兴趣是否相同，供 apply_pair_rule 使用。
+
+    :param dormitory: 寝室整数编码数组
+    :param interest: 兴趣整数编码数组
+    :param rows: 学生对的行下标（一维数组，或可与 cols 广播的数组，如一个行块与全部学生）
+    :param cols: 学生对的列下标
+    :param mask: 可选的布尔掩码（与广播后的形状相同），只有为 True 的学生对参与规则，如行块中的上三角
+    :return: (同寝室布尔掩码（形状为 rows、cols 广播后的形状）, 兴趣相同的学生对在展平后的位置)
+    """
+    same_dormitory = dormitory[rows] == dormitory[cols]
+    same_interest = interest[rows] == interest[cols]
+    if mask is not None:
+        same_dormitory &= mask
+        same_interest &= mask
+    return same_dormitory, np.flatnonzero(same_interest)
+
+
+def apply_pair_rule(change, day, matches, probability, uniform):
+    """
+    学生对的属性规则（各种向量化更新方式共用）：前 50 天同寝室的关系波动翻倍；
+    兴趣相同的学生对以 probability 的概率加 0.02。
+
+    :param change: 当天的关系波动（原地修改），形状与 matches 对应
+    :param day: 天数
+    :param matches: pair_attribute_matches 的返回值（可以预先计算并缓存）
+    :param probability: 兴趣相同时加 0.02 的概率
+    :param uniform: 函数，参数为兴趣相同的学生对的位置，返回等长的 [0, 1) 均匀随机数
+    :return: change
+    """
+    same_dormitory, same_interest = matches
+    if day < 50:
+        change[same_dormitory] *= 2  # 同寝室关系波动翻倍
+    hits = uniform(same_interest) < probability
+    change.reshape(-1)[same_interest[hits]] += 0.02
+    return change
+
+
+def check_state(relationships, state):
+    """
+    续跑前检查保存的状态是否来自同样设置的模拟：类名、学生数与 relationships.settings() 中的各项
+    （如 update_mode、storage、dtype、k）必须一致，否则抛出 ValueError（而不是在恢复时出错或悄悄得到不同的模拟）。
+
+    :param relationships: 关系类实例（需提供 num_students 与 settings）
+    :param state: get_state 返回（或从检查点读取）的 {名称: 数组}
+    """
+    expected = dict(class_name=type(relationships).__name__, num_students=relationships.num_students,
+                    **relationships.settings())
+    saved = {'class_name': str(state['class_name']), 'num_students': int(state['num_students'])}
+    if 'settings' in state:
+        saved.update(json.loads(str(state['settings'])))
+    mismatched = {key: (saved[key], value) for key, value in expected.items() if key in saved and saved[key] != value}
+    if mismatched:
+        details = '，'.join(f"{key}：保存时为 {old!r}，当前为 {new!r}" for key, (old, new) in mismatched.items())
+        raise ValueError(f"状态与当前的 {type(relationships).__name__} 设置不一致（{details}）")
+
+
+class _PairwiseRelationship:
+    """
+    三种关系类共用的部分：关系矩阵、类别属性编码与各种每日更新方式。
+    update_mode='loop' 保持原有的逐对 random.gauss 写法（随机数来自实例自己的 random.Random）；
+    'batch' 每天用 numpy.random.Generator 按 block_size 行分块抽取上三角的波动，再对称写回
+    （临时内存为 block_size×n，不保存 n² 长的学生对下标）；'kernel' 使用 kernels.py 的
+    逐对编译内核（numba，不可用时退回 NumPy），每对学生的随机数由计数器生成，与遍历顺序无关。
+    'event' 由接触模型（contacts.ContactModel）抽取当天真正交往的学生对，只更新这些学生对，
+    每天的计算量与交往次数成正比而不是 n²。
+    storage='sparse' 时关系矩阵以 CSR 存储，只保留绝对值超过 cutoff 的学生对，
+    每日波动按 block_size 行分块生成，临时内存为 block_size×n。稀疏存储只在 event 模式（每天只触及少数学生对）
+    或 cutoff > 0 的 batch 模式下有意义：batch 模式每天给所有学生对加波动，cutoff 为 0 时几乎所有学生对都会被存储，
+    既不省内存又比稠密存储慢一个数量级，因此这种组合会被拒绝。
+    """
+    update_modes = ('loop', 'batch', 'kernel', 'event')  # 可选的每日更新方式
+    storages = ('dense', 'sparse')  # 可选的关系矩阵存储方式
+    pair_attributes = ()  # 参与学生对规则的类别属性
+    interest_probability = None  # 兴趣相同时增加 0.02 的概率，None 表示不考虑属性
+
+    def __init__(self, students, update_mode='loop', seed=None, dtype=np.float64,
+                 storage='dense', cutoff=0.0, block_size=1024, contact_model=None):
         """
-        初始化 InitialRelationship 类。
         :param students: 学生列表，每个学生是一个字典，包含学生信息。
+        :param update_mode: 每日更新方式，'loop'（默认）、'batch'、'kernel' 或 'event'。
+        :param seed: 随机数种子（整数、None 或 numpy.random.SeedSequence，见 rng.py）；
+                     loop 模式用于 random.Random，其余模式用于 numpy 随机数生成器。
+        :param dtype: 关系矩阵的数据类型，np.float32 或 np.float64。
+        :param storage: 关系矩阵存储方式，'dense'（默认）或 'sparse'（需要 update_mode='batch' 或 'event'）。
+        :param cutoff: 稀疏模式下保留关系的最小绝对值，0 表示保留所有非零关系（batch 模式下须大于 0）。
+        :param block_size: batch、kernel（NumPy 实现）与稀疏模式下每次处理的行数（event 模式下为每次处理的学生对数）。
+        :param contact_model: event 模式使用的 contacts.ContactModel，默认 ContactModel()；
+                              其 seed 为 None 时，兴趣小组的随机数流由 seed 派生（见 rng.spawn）。
         """
+        if update_mode not in self.update_modes:
+            raise ValueError(f"update_mode 必须是 {self.update_modes} 之一，收到 {update_mode!r}")
+        if storage not in self.storages:
+            raise ValueError(f"storage 必须是 {self.storages} 之一，收到 {storage!r}")
+        if storage == 'sparse' and update_mode not in ('batch', 'event'):
+            raise ValueError("storage='sparse' 只支持 update_mode='batch' 或 'event'")
+        if storage == 'sparse' and update_mode == 'batch' and cutoff <= 0:
+            raise ValueError("storage='sparse' 与 update_mode='batch' 需要 cutoff > 0，否则几乎所有学生对都会被存储；"
+                             "请改用 storage='dense'，或使用 update_mode='event'")
         self.students = students
         self.num_students = len(students)  # 学生数量
-        self.relationship_matrix = np.zeros((self.num_students, self.num_students), dtype=float)
+        self.update_mode = update_mode
+        self.storage = storage
+        self.cutoff = cutoff
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        if storage == 'sparse':
+            import scipy.sparse as sp
+            self.relationship_matrix = sp.csr_matrix((self.num_students, self.num_students), dtype=dtype)
+        else:
+            self.relationship_matrix = np.zeros((self.num_students, self.num_students), dtype=dtype)
+        self.rng = np.random.default_rng(seed)
+        self.random = python_random(seed)  # loop 模式的逐对随机数
+        self._handed_out = False  # 当前矩阵是否已交给外部（get_relationship_matrix 或观察者），见 _detach
+        # 类别属性在构造时编码一次，之后的每日更新不再读取学生字典
+        self.attribute_codes = {key: codes for key, (codes, _) in
+                                encode_attributes(students, self.pair_attributes).items()}
+        if update_mode == 'kernel':
+            import kernels
+
+            self._kernel_key = kernels.kernel_key(self.rng)
+        if update_mode == 'event':
+            from contacts import ContactModel
+
+            self.contact_model = copy.copy(contact_model) if contact_model is not None else ContactModel()
+            if self.contact_model.seed is None:  # 与每日波动独立的子随机数流，每次重复各不相同
+                self.contact_model.seed = integer_seed(spawn(seed, 1)[0])
+            self.contact_model.prepare(self.num_students, self.attribute_codes)
+            self._touched = (np.zeros(0, dtype=np.int64),) * 2  # 当天交往过的学生对（去重，i < j）
 
-    def simulate_relationships(self, days=30):
+    def simulate_relationships(self, days=30, checkpointer=None, observers=()):
         """
-        模拟学生之间的随机关系变化，迭代更新每一对学生的关系。
+        模拟学生之间的关系变化，逐日调用 _step。
         :param days: 模拟的天数，默认 30 天。
+        :param checkpointer: 可选的 checkpoint.Checkpointer；若其目录中已有检查点，
+                             先恢复到该检查点，再继续模拟到第 days 天。
+        :param observers: 每天结束后调用 observer.observe(已完成天数, 关系矩阵) 的对象，
+                          例如 recorder.TrajectoryRecorder。观察者可以保留收到的矩阵，之后的模拟不会修改它。
         """
-        for _ in range(days):
-            for i in range(self.num_students):
-                for j in range(i + 1, self.num_students):  # 遍历每一对学生，避免重复和自循环
-                    # 根据天数和关系类型调整关系波动（正太分布）
-                    change = random.gauss(0, 1)
-                    self.relationship_matrix[i][j] += change
-                    self.relationship_matrix[j][i] += change  # 确保对称性
+        start_day = checkpointer.restore(self, days) if checkpointer is not None else 0
+        for day in range(start_day, days):
+            self._step(day)
+            if observers:
+                matrix = self.get_relationship_matrix()
+                for observer in observers:
+                    observer.observe(day + 1, matrix)
+            if checkpointer is not None:
+                checkpointer.maybe_save(self, day + 1, final=day + 1 == days)
 
-    def get_relationship_matrix(self):
+    def settings(self):
         """
-        返回最终的关系矩阵。
+        决定模拟结果的设置，保存在状态中；续跑时必须一致（见 check_state）。
         """
-        return self.relationship_matrix
+        settings = {'update_mode': self.update_mode, 'storage': self.storage, 'dtype': self.dtype.name,
+                    'cutoff': float(self.cutoff)}
+        if self.storage == 'sparse' or self.update_mode == 'batch':  # 分块大小决定随机数的抽取顺序
+            settings['block_size'] = int(self.block_size)
+        return settings
 
-    def display_relationship_matrix(self):
+    def get_state(self):
         """
-        打印关系矩阵，用于调试和展示。
+        返回可续跑的模拟状态（关系矩阵、两个随机数生成器的状态与 settings），值均为 NumPy 数组。
         """
-        print("Relationship Matrix:")
-        print(self.relationship_matrix)
+        state = {
+            'class_name': np.array(type(self).__name__),
+            'num_students': np.array(self.num_students),
+            'settings': np.array(json.dumps(self.settings())),
+            'rng_state': np.array(json.dumps(self.rng.bit_generator.state)),
+            'random_state': np.array(json.dumps(self.random.getstate())),  # loop 模式的 random.Random
+        }
+        if self.update_mode == 'kernel':
+            state['kernel_key'] = np.array(self._kernel_key)
+        if self.update_mode == 'event':
+            state['contact_seed'] = np.array(str(self.contact_model.seed))  # 兴趣小组分组，续跑时保持不变
+        if self.storage == 'sparse':
+            state['matrix_data'] = self.relationship_matrix.data
+            state['matrix_indices'] = self.relationship_matrix.indices
+            state['matrix_indptr'] = self.relationship_matrix.indptr
+        else:
+            state['matrix'] = self.relationship_matrix
+        return state
 
+    def set_state(self, state):
+        """
+        从 get_state 的结果恢复模拟状态。
+        :param state: {名称: 数组}
+        """
+        check_state(self, state)
+        self.rng.bit_generator.state = json.loads(str(state['rng_state']))
+        version, internal_state, gauss_next = json.loads(str(state['random_state']))
+        self.random.setstate((version, tuple(internal_state), gauss_next))
+        if 'kernel_key' in state:
+            self._kernel_key = np.uint64(state['kernel_key'])
+        if 'contact_seed' in state and str(state['contact_seed']) != str(self.contact_model.seed):
+            self.contact_model.seed = int(str(state['contact_seed']))
+            self.contact_model.prepare(self.num_students, self.attribute_codes)
+        if self.storage == 'sparse':
+            import scipy.sparse as sp
+            self.relationship_matrix = sp.csr_matrix(
+                (state['matrix_data'], state['matrix_indices'], state['matrix_indptr']),
+                shape=(self.num_students, self.num_students))
+        else:
+            self.relationship_matrix = np.array(state['matrix'], dtype=self.dtype)
 
-class BaseRelationship:
-    def __init__(self, students):
+    def _step(self, day):
         """
-        初始化 BaseRelationship 类。
-        :param students: 学生列表，每个学生是一个字典，包含学生信息。
+        单日更新：默认只有关系波动，StructureRelationship 在此之后叠加结构压力。
         """
-        self.students = students
-        self.num_students = len(students)  # 学生数量
-        self.relationship_matrix = np.zeros((self.num_students, self.num_students), dtype=float)
+        self._daily_changes(day)
 
-    def simulate_relationships(self, days=30):
+    def _daily_changes(self, day):
         """
-        模拟学生之间的随机关系变化。
-        :param days: 模拟的天数，默认 30 天。
+        按 update_mode 与 storage 选择当天关系波动的实现。
+        """
+        self._detach()
+        if self.update_mode == 'event':
+            self._event_changes(day)
+        elif self.storage == 'sparse':
+            self._sparse_batch_changes(day)
+        elif self.update_mode == 'batch':
+            self._batch_changes(day)
+        elif self.update_mode == 'kernel':
+            self._kernel_changes(day)
+        else:
+            self._loop_changes(day)
+
+    def _loop_changes(self, day):
+        """
+        逐对学生更新当天的关系波动（原始写法），由子类实现。
+        """
+        raise NotImplementedError
+
+    def _kernel_changes(self, day):
+        """
+        由逐对内核原地更新当天的关系波动，规则与 _block_changes 相同，但随机数来自计数器随机数。
+        """
+        import kernels
+
+        kernels.apply_pair_changes(self.relationship_matrix, self._kernel_key, day,
+                                   self.attribute_codes.get('dormitory'), self.attribute_codes.get('interest'),
+                                   self.interest_probability, self.block_size)
+
+    def _batch_changes(self, day):
+        """
+        按行块生成当天所有学生对的关系波动（见 _block_changes），并对称地加到稠密关系矩阵上。
+        """
+        for start in range(0, self.num_students, self.block_size):
+            stop = min(start + self.block_size, self.num_students)
+            add_upper_block(self.relationship_matrix, start, self._block_changes(day, start, stop))
+
+    def _uniform(self, index):
+        """
+        apply_pair_rule 的随机数来源：为 index 中的每个学生对抽取一个 [0, 1) 均匀随机数。
         """
-        for day in range(days):
-            for i in range(self.num_students):
-                for j in range(i + 1, self.num_students):  # 遍历每一对学生，避免重复和自循环
-                    # 根据天数和关系类型调整关系波动（正太分布）
-                    change = random.gauss(0, 1)
+        return self.rng.random(len(index))
 
-                    # 前50天寝室相同的学生关系波动翻倍
-                    if day < 50 and self.students[i]['dormitory'] == self.students[j]['dormitory']:
-                        change *= 2  # 同寝室关系波动翻倍
+    def _sparse_batch_changes(self, day):
+        """
+        稀疏模式下的每日波动：按行块取出上三角的当前值，叠加波动后只保留
+        绝对值超过 cutoff 的学生对，最后拼成对称的 CSR 矩阵。
+        """
+        import scipy.sparse as sp
+
+        n = self.num_students
+        upper = sp.triu(self.relationship_matrix, 1, format='csr')
+        rows, cols, values = [], [], []
+        for start in range(0, n, self.block_size):
+            stop = min(start + self.block_size, n)
+            block = upper[start:stop].toarray()
+            block += self._block_changes(day, start, stop)
+            keep = np.triu(np.abs(block) > self.cutoff, start + 1)  # 只保留上三角 j > i（行块中的下三角为 0）
+            block_rows, block_cols = np.nonzero(keep)
+            rows.append(block_rows + start)
+            cols.append(block_cols)
+            values.append(block[block_rows, block_cols].astype(self.dtype, copy=False))
+        rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+        upper = sp.csr_matrix((values, (rows, cols)), shape=(n, n))
+        self.relationship_matrix = (upper + upper.T).tocsr()
+
+    def _event_changes(self, day):
+        """
+        事件驱动的每日波动：只对接触模型抽到的学生对按 _block_changes 的规则抽取波动，
+        同一学生对一天内多次交往时波动累加。未交往的学生对保持不变。
+        """
+        rows, cols = self.contact_model.interactions(day, self.rng)
+        change = self.rng.standard_normal(len(rows))
+        if self.interest_probability is not None:
+            matches = pair_attribute_matches(self.attribute_codes['dormitory'], self.attribute_codes['interest'],
+                                             rows, cols)
+            apply_pair_rule(change, day, matches, self.interest_probability, self._uniform)
+        n = self.num_students
+        keys, inverse = np.unique(rows * n + cols, return_inverse=True)
+        change = np.bincount(inverse, weights=change, minlength=len(keys)).astype(self.dtype, copy=False)
+        self._touched = (keys // n, keys % n)
+        self._add_pair_values(change)
+
+    def _add_pair_values(self, values, clip=None):
+        """
+        把 values 对称地加到 self._touched 中的学生对上；稀疏模式下随后剔除不超过 cutoff 的关系。
 
-                    # 对于兴趣相同的学生，有20%的概率增加0.02的关系
-                    if self.students[i]['interest'] == self.students[j]['interest']:
-                        if random.random() < 0.5:  # 生成一个0到1之间的随机数，20%的概率小于0.2
-                            change += 0.02
+        :param values: 与学生对等长的增量
+        :param clip: 可选的截断上限 m，相加后截断到 [-m, m]（只影响 self._touched 中的学生对）
+        """
+        rows, cols = self._touched
+        n = self.num_students
+        if self.storage == 'dense':
+            flat = self.relationship_matrix.reshape(-1)
+            upper = rows * n + cols
+            updated = flat[upper] + values  # 学生对已去重，可以直接散射
+            if clip is not None:
+                np.clip(updated, -clip, clip, out=updated)
+            flat[upper] = updated
+            flat[cols * n + rows] = updated
+            return
+        import scipy.sparse as sp
+
+        delta = sp.csr_matrix((np.concatenate((values, values)),
+                               (np.concatenate((rows, cols)), np.concatenate((cols, rows)))), shape=(n, n))
+        matrix = (self.relationship_matrix + delta).tocsr()
+        if clip is not None:  # 未交往的学生对此前已在范围内，整体截断不会改变它们
+            np.clip(matrix.data, -clip, clip, out=matrix.data)
+        matrix.data[np.abs(matrix.data) <= self.cutoff] = 0
+        matrix.eliminate_zeros()
+        self.relationship_matrix = matrix.astype(self.dtype, copy=False)
 
-                    self.relationship_matrix[i][j] += change
-                    self.relationship_matrix[j][i] += change  # 确保对称性
+    def _block_changes(self, day, start, stop):
+        """
+        生成第 start 到 stop 行与所有学生之间的当天波动，只为上三角（j > i）的学生对抽取随机数，其余位置为 0。
+        规则与逐对循环一致：前 50 天同寝室波动翻倍；兴趣相同者按 interest_probability 的概率加 0.02。
+        """
+        rows, cols = np.arange(start, stop)[:, None], np.arange(self.num_students)[None, :]
+        upper = cols > rows
+        change = np.zeros(upper.shape)
+        change[upper] = self.rng.standard_normal(np.count_nonzero(upper))
+        if self.interest_probability is not None:
+            matches = pair_attribute_matches(self.attribute_codes['dormitory'], self.attribute_codes['interest'],
+                                             rows, cols, upper)
+            apply_pair_rule(change, day, matches, self.interest_probability, self._uniform)
+        return change
 
     def get_relationship_matrix(self):
         """
-        返回最终的关系矩阵。
+        返回当前的关系矩阵。返回的矩阵不会被之后的模拟修改（下一次更新前会先复制，见 _detach）。
         """
+        self._handed_out = True
         return self.relationship_matrix
 
+    def _detach(self):
+        """
+        每日更新开始前调用：当前矩阵已交给外部时先复制一份再原地更新（写时复制），
+        StructureRelationship 的双缓冲因此也不会写入已交出的矩阵；没有交出时不复制。
+        """
+        if self._handed_out:
+            self.relationship_matrix = self.relationship_matrix.copy()
+            self._handed_out = False
+
     def display_relationship_matrix(self):
         """
         打印关系矩阵，用于调试和展示。
@@ -87,71 +507,212 @@ class BaseRelationship:
         print("Relationship Matrix:")
         print(self.relationship_matrix)
 
-class StructureRelationship:
-    def __init__(self, students, k=0.0015):
+
+class InitialRelationship(_PairwiseRelationship):
+    def __init__(self, students, **options):
+        """
+        初始化 InitialRelationship 类。
+        :param students: 学生列表，每个学生是一个字典，包含学生信息。
+        :param options: update_mode、seed、dtype、storage 等，见 _PairwiseRelationship。
+        """
+        super().__init__(students, **options)
+
+    def _loop_changes(self, day):
+        """
+        模拟学生之间的随机关系变化，迭代更新每一对学生的关系。
+        """
+        for i in range(self.num_students):
+            for j in range(i + 1, self.num_students):  # 遍历每一对学生，避免重复和自循环
+                # 根据天数和关系类型调整关系波动（正太分布）
+                change = self.random.gauss(0, 1)
+                self.relationship_matrix[i][j] += change
+                self.relationship_matrix[j][i] += change  # 确保对称性
+
+
+class BaseRelationship(_PairwiseRelationship):
+    pair_attributes = ('dormitory', 'interest')
+    interest_probability = 0.5
+
+    def __init__(self, students, **options):
+        """
+        初始化 BaseRelationship 类。
+        :param students: 学生列表，每个学生是一个字典，包含学生信息。
+        :param options: update_mode、seed、dtype、storage 等，见 _PairwiseRelationship。
+        """
+        super().__init__(students, **options)
+
+    def _loop_changes(self, day):
+        """
+        模拟学生之间的随机关系变化。
+        """
+        dormitory = self.attribute_codes['dormitory'].tolist()  # 逐对循环用列表下标比整数编码更快
+        interest = self.attribute_codes['interest'].tolist()
+        for i in range(self.num_students):
+            for j in range(i + 1, self.num_students):  # 遍历每一对学生，避免重复和自循环
+                # 根据天数和关系类型调整关系波动（正太分布）
+                change = self.random.gauss(0, 1)
+
+                # 前50天寝室相同的学生关系波动翻倍
+                if day < 50 and dormitory[i] == dormitory[j]:
+                    change *= 2  # 同寝室关系波动翻倍
+
+                # 对于兴趣相同的学生，有20%的概率增加0.02的关系
+                if interest[i] == interest[j]:
+                    if self.random.random() < 0.5:  # 生成一个0到1之间的随机数，20%的概率小于0.2
+                        change += 0.02
+
+                self.relationship_matrix[i][j] += change
+                self.relationship_matrix[j][i] += change  # 确保对称性
+
+
+class StructureRelationship(_PairwiseRelationship):
+    engines = ('matrix', 'loop', 'kernel')  # 可选的结构压力计算引擎
+    pair_attributes = ('dormitory', 'interest')
+    interest_probability = 0.2
+
+    def __init__(self, students, k=0.0015, engine='matrix', workers=None, **options):
         """
         初始化 StructureModelRelationship 类。
         :param students: 学生列表，每个学生是一个字典，包含学生信息。
         :param k: 压力调节系数。
+        :param engine: 结构压力计算方式，'matrix'（默认，任何 update_mode 下都是）为分块矩阵乘法（BLAS），
+                       'loop' 为原始三重循环，'kernel' 为编译的标量三重循环（numba 不可用时退回矩阵乘法）。
+                       'kernel' 是 O(n³) 的标量循环，通常比 BLAS 慢，只在基准测试（benchmark.py 的
+                       pressure_step_kernel 与 pressure_step_matrix）表明更快时显式选用；
+                       update_mode='event' 时压力只在当天交往过的学生对之间传递，不使用 engine。
+        :param workers: matrix 引擎分块计算时的线程数（块大小为 block_size 行），None 表示串行。
+        :param options: update_mode、seed、dtype、storage 等，见 _PairwiseRelationship。
         """
-        self.students = students
-        self.num_students = len(students)  # 学生数量
-        self.relationship_matrix = np.zeros((self.num_students, self.num_students), dtype=float)
+        if engine not in self.engines:
+            raise ValueError(f"engine 必须是 {self.engines} 之一，收到 {engine!r}")
+        if engine != 'matrix' and options.get('storage') == 'sparse':
+            raise ValueError(f"engine={engine!r} 不支持 storage='sparse'")
+        super().__init__(students, **options)
         self.k = k  # 压力调节系数
+        self.engine = engine
+        self.workers = workers
+        self._buffer = None  # 双缓冲：新矩阵写入其中后与当前矩阵交换，每天不再分配新矩阵
+
+    def settings(self):
+        """
+        在 _PairwiseRelationship.settings 之外加上压力调节系数 k。
+        """
+        return dict(super().settings(), k=float(self.k))
 
-    def simulate_relationships(self, days=30):
+    def _step(self, day):
         """
         模拟学生之间的关系变化，并加入结构压力传递。
-        :param days: 模拟的天数，默认 30 天。
         """
-        for day in range(days):
-            # 每天的关系更新
-            for i in range(self.num_students):
-                for j in range(i + 1, self.num_students):  # 遍历每一对学生，避免重复和自循环
-                    # 根据天数和关系类型调整关系波动（正态分布）
-                    change = random.gauss(0, 1)
-
-                    # 前50天寝室相同的学生关系波动翻倍
-                    if day < 50 and self.students[i]['dormitory'] == self.students[j]['dormitory']:
-                        change *= 2  # 同寝室关系波动翻倍
-
-                    # 对于兴趣相同的学生，有20%的概率增加0.02的关系
-                    if self.students[i]['interest'] == self.students[j]['interest']:
-                        if random.random() < 0.2:  # 20%的概率
-                            change += 0.02
-
-                    self.relationship_matrix[i][j] += change
-                    self.relationship_matrix[j][i] += change  # 确保对称性
-
-            # 创建一个新的矩阵，用于存储结构压力传递的结果
-            new_relationship_matrix = np.copy(self.relationship_matrix)
-
-            # 结构压力传递更新
-            for a in range(self.num_students):
-                for b in range(self.num_students):
-                    if a != b:
-                        pressure_sum = 0  # 初始化压力
-                        for c in range(self.num_students):
-                            if c != a and c != b:  # 排除自身和目标
-                                pressure_sum += (
-                                    self.k * self.relationship_matrix[a][c] * self.relationship_matrix[c][b]
-                                )
-                        new_relationship_matrix[a][b] += pressure_sum
+        # 每天的关系更新
+        self._daily_changes(day)
+
+        # 结构压力传递更新
+        if self.update_mode == 'event':
+            self._event_pressure_update()
+            return
+        if self.storage == 'sparse':
+            self._sparse_pressure_update()
+            return
+        matrix = self.relationship_matrix
+        if self._buffer is None or self._buffer.shape != matrix.shape or self._buffer.dtype != matrix.dtype:
+            self._buffer = np.empty_like(matrix)
+        if self.engine == 'kernel':
+            import kernels
 
+            kernels.pressure_step(matrix, self.k, out=self._buffer)
+        elif self.engine == 'matrix':
+            blocked_pressure_step(matrix, self.k, out=self._buffer, block_size=self.block_size, workers=self.workers)
+        else:
             # 更新关系矩阵，限制其范围在[-20, 20]之间
-            new_relationship_matrix = np.clip(new_relationship_matrix, -20, 20)
-            # 更新关系矩阵
-            self.relationship_matrix = new_relationship_matrix
+            np.clip(matrix + loop_structure_pressure(matrix, self.k), -20, 20, out=self._buffer)
+        # 交换缓冲：新矩阵成为当前矩阵，旧矩阵的内存留给下一天使用
+        self.relationship_matrix, self._buffer = self._buffer, matrix
 
-    def get_relationship_matrix(self):
+    def _event_pressure_update(self):
         """
-        返回最终的关系矩阵。
+        事件驱动模式下的结构压力：只在当天交往过的学生对 (a, b) 之间传递，
+        pressure[a][b] = k·Σ_{c≠a,b} R[a][c]·R[c][b] 即第 a、b 行的内积（R 对称），
+        先按交往前的矩阵算出全部压力再一起写回，与整矩阵版本同样是同步更新；结果截断到 [-20, 20]。
+        每次处理 block_size 个学生对，计算量为 交往对数 × n（稀疏模式下为两行的非零元数）。
         """
-        return self.relationship_matrix
+        rows, cols = self._touched
+        matrix = self.relationship_matrix
+        if self.storage == 'dense':
+            current = matrix[rows, cols]
+            diag = np.diagonal(matrix)
+        else:
+            current = np.asarray(matrix[rows, cols], dtype=self.dtype).ravel()
+            diag = matrix.diagonal()
+        pressure = np.empty(len(rows), dtype=self.dtype)
+        for start in range(0, len(rows), self.block_size):
+            a, b = rows[start:start + self.block_size], cols[start:start + self.block_size]
+            if self.storage == 'dense':
+                pressure[start:start + len(a)] = np.einsum('ij,ij->i', matrix[a], matrix[b])
+            else:
+                pressure[start:start + len(a)] = np.asarray(matrix[a].multiply(matrix[b]).sum(axis=1)).ravel()
+        pressure -= current * (diag[rows] + diag[cols])  # 去掉 c==a 与 c==b 两项
+        pressure *= self.k
+        self._add_pair_values(pressure, clip=20)
 
-    def display_relationship_matrix(self):
+    def _sparse_pressure_update(self):
         """
-        打印关系矩阵，用于调试和展示。
+        稀疏模式下的结构压力传递：稀疏矩阵乘法后原地截断到 [-20, 20]，并剔除低于 cutoff 的关系。
         """
-        print("Relationship Matrix:")
-        print(self.relationship_matrix)
+        matrix = (self.relationship_matrix + sparse_structure_pressure(self.relationship_matrix, self.k)).tocsr()
+        np.clip(matrix.data, -20, 20, out=matrix.data)
+        matrix.data[np.abs(matrix.data) <= self.cutoff] = 0
+        matrix.eliminate_zeros()
+        self.relationship_matrix = matrix.astype(self.dtype, copy=False)
+
+    def _loop_changes(self, day):
+        """
+        逐对学生更新当天的关系波动（原始写法）。
+        """
+        dormitory = self.attribute_codes['dormitory'].tolist()
+        interest = self.attribute_codes['interest'].tolist()
+        for i in range(self.num_students):
+            for j in range(i + 1, self.num_students):  # 遍历每一对学生，避免重复和自循环
+                # 根据天数和关系类型调整关系波动（正态分布）
+                change = self.random.gauss(0, 1)
+
+                # 前50天寝室相同的学生关系波动翻倍
+                if day < 50 and dormitory[i] == dormitory[j]:
+                    change *= 2  # 同寝室关系波动翻倍
+
+                # 对于兴趣相同的学生，有20%的概率增加0.02的关系
+                if interest[i] == interest[j]:
+                    if self.random.random() < 0.2:  # 20%的概率
+                        change += 0.02
+
+                self.relationship_matrix[i][j] += change
+                self.relationship_matrix[j][i] += change  # 确保对称性
+
+
+if __name__ == '__main__':  # 检验代码：矩阵引擎与三重循环的一致性
+    import scipy.sparse as sp
+
+    rng = np.random.default_rng(0)
+    for n in (2, 5, 12):
+        matrix = rng.normal(0, 5, size=(n, n))
+        matrix = np.triu(matrix, 1) + np.triu(matrix, 1).T
+        np.fill_diagonal(matrix, rng.normal(size=n))  # 对角线非零时同样需要排除 c==a、c==b
+        expected = loop_structure_pressure(matrix, 0.0015)
+        assert np.allclose(structure_pressure(matrix, 0.0015), expected)
+        assert np.allclose(structure_pressure(matrix.astype(np.float32), 0.0015), expected, atol=1e-4)
+        sparse_pressure = sparse_structure_pressure(sp.csr_matrix(matrix), 0.0015)
+        assert np.allclose(sparse_pressure.toarray(), expected)
+        for block_size, workers in ((1, None), (4, 3)):
+            step = blocked_pressure_step(matrix, 0.0015, block_size=block_size, workers=workers)
+            assert np.allclose(step, np.clip(matrix + expected, -20, 20))
+    print("structure_pressure 与三重循环结果一致")
+
+    # 已返回的矩阵（包括交给观察者的矩阵）不会被之后的模拟修改
+    students = [{'dormitory': i // 4, 'interest': i % 5} for i in range(40)]
+    for options in ({'update_mode': 'batch'}, {'update_mode': 'event'}, {'update_mode': 'batch', 'engine': 'loop'}):
+        relationships = StructureRelationship(students, seed=0, **options)
+        relationships.simulate_relationships(days=3)
+        kept = relationships.get_relationship_matrix()
+        snapshot = kept.copy()
+        relationships.simulate_relationships(days=2)
+        assert np.array_equal(kept, snapshot) and not np.array_equal(relationships.get_relationship_matrix(), snapshot)
+    print("已返回的关系矩阵在继续模拟后保持不变")
@@ -0,0 +1,76 @@
+"""此目的在于统一管理随机数：由根种子经 numpy.random.SeedSequence 派生出互相独立的命名随机数流，
+新生生成、每日波动与每次重复各用各的流，结果与导入顺序、前面阶段抽取了多少随机数以及串行、多线程、多进程运行无关"""
+import random
+
+import numpy as np
+
+# 一次模拟内部的随机数流，顺序固定（下标即派生编号），新增的流只能追加在末尾
+REPLICA_STREAMS = ('population', 'noise', 'analysis')
+
+
+def as_seed_sequence(seed=None):
+    """
+    将整数、None 或 SeedSequence 统一为 SeedSequence（SeedSequence 原样返回）。
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def spawn(seed, count):
+    """
+    派生 count 个子种子序列，与第一次调用 seed.spawn(count) 的结果相同，但不修改 seed 的内部计数，
+    因此同一个 SeedSequence 无论被使用多少次、在哪个线程或进程中使用，派生出的子序列都相同。
+
+    :param seed: 整数、None 或 SeedSequence
+    :param count: 子序列个数
+    :return: SeedSequence 列表
+    """
+    seed = as_seed_sequence(seed)
+    return [np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (index,), pool_size=seed.pool_size)
+            for index in range(count)]
+
+
+def replica_seeds(seed, replicas):
+    """
+    每次重复的种子序列：第 i 次重复只由根种子与 i 决定，与重复的执行顺序和执行方式无关。
+    """
+    return spawn(seed, replicas)
+
+
+def replica_streams(seed):
+    """
+    一次模拟的各个随机数流，返回 {流名称: SeedSequence}，名称见 REPLICA_STREAMS。
+    """
+    return dict(zip(REPLICA_STREAMS, spawn(seed, len(REPLICA_STREAMS))))
+
+
+def integer_seed(seed):
+    """
+    由 SeedSequence 生成 128 位整数种子（可以写入检查点并原样恢复）；整数与 None 原样返回。
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        state = seed.generate_state(4, np.uint32)
+        return sum(int(word) << (32 * index) for index, word in enumerate(state))
+    return seed
+
+
+def python_random(seed=None):
+    """
+    创建独立的 random.Random 实例，供逐对循环（loop 模式）使用，不再依赖全局 random。
+    整数种子与 random.seed(整数) 得到相同的序列；SeedSequence 先生成 128 位整数再作为种子。
+    """
+    return random.Random(integer_seed(seed))
+
+
+if __name__ == '__main__':  # 检验代码：派生结果不依赖调用次数，与 SeedSequence.spawn 一致
+    root = np.random.SeedSequence(42)
+    first = [child.generate_state(2) for child in spawn(root, 3)]
+    second = [child.generate_state(2) for child in spawn(root, 3)]
+    reference = [child.generate_state(2) for child in np.random.SeedSequence(42).spawn(3)]
+    assert all(np.array_equal(a, b) and np.array_equal(a, c) for a, b, c in zip(first, second, reference))
+    streams = replica_streams(42)
+    assert np.random.default_rng(streams['population']).random() != np.random.default_rng(streams['noise']).random()
+    assert python_random(7).random() == random.Random(7).random()
+    print({name: sequence.spawn_key for name, sequence in streams.items()})
+    print('派生的随机数流与调用次数无关')
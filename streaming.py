@@ -0,0 +1,446 @@
+"""此目的在于逐日流式分析阈值化的社会网络：位压缩的邻接矩阵、并查集连通分量、聚类系数与 Louvain 社区，
+每天只处理跨过阈值的边，不再每天重建 networkx 图"""
+import numpy as np
+
+from network import _is_sparse
+
+METRICS = ('edges', 'added', 'removed', 'density', 'components', 'largest_component', 'triangles',
+           'transitivity', 'average_clustering', 'communities', 'largest_community', 'modularity')
+
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:  # NumPy < 2.0：按字节查表
+    _POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+def pack_adjacency(matrix, threshold=5, block_size=1024):
+    """
+    按行块将关系矩阵阈值化并位压缩：第 i 行第 j 位为 1 表示 matrix[i][j] > threshold，对角线为 0。
+    结果占 n×n/8 字节，临时内存为 block_size×n 的布尔块，不生成 n×n 的整数邻接矩阵。
+
+    :param matrix: 关系矩阵（稠密或 scipy.sparse；稀疏矩阵要求 threshold >= 0）
+    :param threshold: 邻接矩阵阈值
+    :param block_size: 每次处理的行数
+    :return: 形状为 (n, ceil(n/8)) 的 uint8 数组
+    """
+    n = matrix.shape[0]
+    sparse = _is_sparse(matrix)
+    if sparse:
+        if threshold < 0:
+            raise ValueError("稀疏关系矩阵只支持非负阈值（未存储的关系为 0）")
+        matrix = matrix.tocsr()
+    packed = np.empty((n, (n + 7) // 8), dtype=np.uint8)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = matrix[start:stop].toarray() if sparse else np.asarray(matrix[start:stop])
+        bits = block > threshold
+        bits[np.arange(stop - start), np.arange(start, stop)] = False  # 不含自环
+        packed[start:stop] = np.packbits(bits, axis=1)
+    return packed
+
+
+def unpack_rows(packed, rows, num_nodes):
+    """
+    将位压缩邻接矩阵的若干行还原为布尔数组 (len(rows), num_nodes)。
+    """
+    return np.unpackbits(packed[rows], axis=1, count=num_nodes).astype(bool)
+
+
+class UnionFind:
+    """
+    批量（向量化）并查集：一次合并一批边，每轮把较大的根挂到较小的根上，再做指针跳跃压缩路径，
+    直到这批边的两端都在同一集合。只支持合并，删除边后需要 reset 并重新合并。
+    """
+
+    def __init__(self, num_nodes):
+        self.parent = np.arange(num_nodes)
+
+    def reset(self):
+        self.parent = np.arange(len(self.parent))
+
+    def _compress(self):
+        while True:
+            grandparent = self.parent[self.parent]
+            if np.array_equal(grandparent, self.parent):
+                return
+            self.parent = grandparent
+
+    def find(self, nodes=None):
+        """
+        返回 nodes（默认全部节点）的根；根是集合中编号最小的节点。
+        """
+        self._compress()
+        return self.parent if nodes is None else self.parent[nodes]
+
+    def union(self, u, v):
+        """
+        合并边 (u[k], v[k]) 两端所在的集合。
+        """
+        u, v = np.asarray(u), np.asarray(v)
+        while len(u):
+            root_u, root_v = self.find(u), self.find(v)
+            pending = root_u != root_v
+            if not pending.any():
+                return
+            u, v, root_u, root_v = u[pending], v[pending], root_u[pending], root_v[pending]
+            low, high = np.minimum(root_u, root_v), np.maximum(root_u, root_v)
+            np.minimum.at(self.parent, high, low)
+
+    def sizes(self):
+        """
+        返回每个节点所在集合的大小。
+        """
+        roots = self.find()
+        return np.bincount(roots, minlength=len(roots))[roots]
+
+
+def _representatives(labels):
+    """
+    把社区编号统一为社区中编号最小的节点。
+    """
+    groups, inverse = np.unique(labels, return_inverse=True)
+    representative = np.full(len(groups), len(labels))
+    np.minimum.at(representative, inverse, np.arange(len(labels)))
+    return representative[inverse]
+
+
+def modularity(source, target, weight, labels):
+    """
+    加权无向图中划分 labels 的模块度（与 networkx.community.modularity 的定义相同）。
+
+    :param source: 有向边的起点：每条无向边的两个方向各出现一次，自环出现一次且权重为内部边权重的 2 倍
+    :param target: 有向边的终点
+    :param weight: 有向边的权重
+    :param labels: 节点的社区编号（0 到节点数-1）
+    """
+    total = weight.sum()
+    if total == 0:
+        return 0.0
+    size = len(labels)
+    inside = labels[source] == labels[target]
+    internal = np.bincount(labels[source][inside], weights=weight[inside], minlength=size)
+    strength = np.bincount(labels[source], weights=weight, minlength=size)
+    return float(np.sum(internal / total - (strength / total) ** 2))
+
+
+def _local_moving(source, target, weight, labels, rng, rounds):
+    """
+    Louvain 的局部移动阶段（向量化）：每轮用稀疏矩阵乘法（邻接矩阵 × 社区成员矩阵）求出活跃节点与各相邻社区之间的
+    边权重与模块度增益，在能提高模块度的节点中随机移动一半（同时移动全部节点时相邻节点会来回交换）；
+    下一轮只检查移动过的节点及其邻居（与 Leiden 的快速局部移动相同），直到没有节点能提高模块度。
+
+    :return: 新的社区编号
+    """
+    import scipy.sparse as sp
+
+    size = len(labels)
+    total = weight.sum()
+    strength = np.bincount(source, weights=weight, minlength=size)
+    link = source != target  # 自环（聚合后社区内部的边）不计入节点与社区之间的连接
+    adjacency = sp.csr_matrix((weight[link], (source[link], target[link])), shape=(size, size))
+    labels = labels.copy()
+    active = np.ones(size, dtype=bool)
+    for _ in range(rounds):
+        rows = np.flatnonzero(active)
+        membership = sp.csr_matrix((np.ones(size), (np.arange(size), labels)), shape=(size, size))
+        connection = (adjacency[rows] @ membership).tocsr()  # 节点与各相邻社区之间的边权重
+        counts = np.diff(connection.indptr)
+        if not connection.nnz:
+            break
+        nodes, candidates = np.repeat(rows, counts), connection.indices
+        community_strength = np.bincount(labels, weights=strength, minlength=size)
+        own = candidates == labels[nodes]
+        k = strength[nodes]
+        gain = connection.data - k * (community_strength[candidates] - np.where(own, k, 0)) / total
+        # 留在原社区的增益；与原社区没有连接的节点只有期望项
+        stay = -strength * (community_strength[labels] - strength) / total
+        stay[nodes[own]] = gain[own]
+        # 每个节点取增益最大的候选社区
+        starts = connection.indptr[:-1][counts > 0]
+        best_gain = np.repeat(np.maximum.reduceat(gain, starts), counts[counts > 0])
+        positions = np.flatnonzero(gain == best_gain)
+        first = positions[np.r_[True, nodes[positions][1:] != nodes[positions][:-1]]]
+        best_nodes, best_labels = nodes[first], candidates[first]
+        improving = (best_labels != labels[best_nodes]) & (gain[first] > stay[best_nodes] + 1e-12)
+        if not improving.any():
+            break
+        movers = improving & (rng.random(len(first)) < 0.5)
+        if not movers.any():  # 至少移动一个节点，保证每轮都有进展
+            movers[np.flatnonzero(improving)[0]] = True
+        labels[best_nodes[movers]] = best_labels[movers]
+        active[:] = False
+        active[best_nodes[improving & ~movers]] = True  # 本轮未轮到移动的节点下一轮仍需检查
+        moved = best_nodes[movers]
+        active[moved] = True
+        active[adjacency[moved].indices] = True  # 移动过的节点的邻居
+    return labels
+
+
+def louvain(source, target, weight, num_nodes, initial=None, rng=None, rounds=50):
+    """
+    向量化的 Louvain 社区发现：局部移动与社区聚合交替进行，直到局部移动不再改变划分。
+
+    :param source: 有向边的起点（每条无向边两个方向各出现一次）
+    :param target: 有向边的终点
+    :param weight: 有向边的权重
+    :param num_nodes: 节点数
+    :param initial: 第一层局部移动的初始划分（热启动），默认每个节点自成一个社区
+    :param rng: numpy 随机数生成器
+    :param rounds: 每一层局部移动的最大轮数
+    :return: 每个节点的社区编号（0 到社区数-1）
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    level_labels = np.arange(num_nodes) if initial is None else np.unique(initial, return_inverse=True)[1]
+    membership = np.arange(num_nodes)  # 原图节点 -> 当前聚合图的节点
+    size = num_nodes
+    while True:
+        level_labels = _local_moving(source, target, weight, level_labels, rng, rounds)
+        level_labels = np.unique(level_labels, return_inverse=True)[1]
+        membership = level_labels[membership]
+        count = level_labels.max() + 1 if size else 0
+        if count == size:  # 局部移动没有合并任何节点
+            return membership
+        # 把每个社区聚合为一个节点，社区之间的边权重相加，社区内部的边成为自环
+        keys, inverse = np.unique(level_labels[source] * count + level_labels[target], return_inverse=True)
+        weight = np.bincount(inverse, weights=weight)
+        source, target = keys // count, keys % count
+        size = count
+        level_labels = np.arange(size)
+
+
+class NetworkStream:
+    """
+    阈值化社会网络的流式分析，可作为 simulate_relationships 的观察者（observers 参数）。
+    每天将关系矩阵阈值化为位压缩邻接矩阵，与前一天异或得到新增与消失的边，然后增量维护：
+    - 连通分量：新增的边并入并查集；有边消失时用当前边重新合并；
+    - 三角形与聚类系数：每条边记录两端的共同邻居数（两行按位与后计数），只重算端点的邻居发生变化的边；
+    - 社区：向量化的 Louvain（见 louvain），以前一天的社区为初值热启动，并与从头计算的结果比较、保留模块度较高者；
+      连通分量分裂时先把跨分量的标签拆开。
+    每天的指标（见 METRICS）保存在 history 中，用 time_series 读取。
+    """
+
+    def __init__(self, threshold=5, block_size=1024, label_rounds=50, seed=42, keep_history=True):
+        """
+        :param threshold: 邻接矩阵阈值
+        :param block_size: 阈值化与计算共同邻居时每次处理的行数（边数）
+        :param label_rounds: Louvain 每一层局部移动的最大轮数
+        :param seed: Louvain 局部移动中随机选择移动节点的种子
+        :param keep_history: 是否保留每天的指标
+        """
+        self.threshold = threshold
+        self.block_size = block_size
+        self.label_rounds = label_rounds
+        self.rng = np.random.default_rng(seed)
+        self.keep_history = keep_history
+        self.num_nodes = 0
+        self.packed = None  # 位压缩邻接矩阵
+        self.edges = np.zeros(0, dtype=np.int64)  # 排好序的边编号 i * n + j（i < j）
+        self.common = np.zeros(0, dtype=np.int64)  # 与 edges 对齐的共同邻居数
+        self.degree = None
+        self.components = None
+        self.labels = None
+        self.history = []  # [(天数, 指标字典)]
+
+    def _reset(self, num_nodes):
+        self.num_nodes = num_nodes
+        self.packed = np.zeros((num_nodes, (num_nodes + 7) // 8), dtype=np.uint8)
+        self.edges = np.zeros(0, dtype=np.int64)
+        self.common = np.zeros(0, dtype=np.int64)
+        self.degree = np.zeros(num_nodes, dtype=np.int64)
+        self.components = UnionFind(num_nodes)
+        self.labels = np.arange(num_nodes)
+
+    def update(self, matrix, day=None):
+        """
+        根据最新的关系矩阵增量更新网络与各项指标。
+        :param matrix: 关系矩阵（稠密或 scipy.sparse）
+        :param day: 可选的天数，记录在 history 中
+        :return: 指标字典（键见 METRICS）
+        """
+        n = matrix.shape[0]
+        if self.packed is None or n != self.num_nodes:
+            self._reset(n)
+        packed = pack_adjacency(matrix, self.threshold, self.block_size)
+        added, removed = self._changed_edges(packed)
+        self.packed = packed
+
+        previous_edges, previous_common = self.edges, self.common
+        self.edges = np.union1d(np.setdiff1d(previous_edges, removed, assume_unique=True), added)
+        rows, cols = self.edges // n, self.edges % n
+        self.degree = np.bincount(np.concatenate((rows, cols)), minlength=n)
+
+        if len(removed):
+            self.components.reset()
+            self.components.union(rows, cols)
+            self._split_labels()
+        else:
+            self.components.union(added // n, added % n)
+
+        changed = np.concatenate((added, removed))
+        touched = np.zeros(n, dtype=bool)
+        touched[changed // n] = touched[changed % n] = True
+        self._update_common(previous_edges, previous_common, touched)
+        self._update_communities(touched)
+
+        metrics = self._metrics(len(added), len(removed))
+        if self.keep_history:
+            self.history.append((day, metrics))
+        return metrics
+
+    def observe(self, day, matrix):
+        """
+        观察者接口：模拟完成第 day 天后调用。
+        """
+        self.update(matrix, day=day)
+
+    def _changed_edges(self, packed):
+        """
+        返回 (新增的边编号, 消失的边编号)，只还原异或结果非零的行。
+        """
+        n = self.num_nodes
+        difference = packed ^ self.packed
+        rows = np.flatnonzero(difference.any(axis=1))
+        if not rows.size:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        added, removed = [], []
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            flips = unpack_rows(difference, block, n)
+            flips &= np.arange(n)[None, :] > block[:, None]  # 只取上三角 j > i
+            block_rows, cols = np.nonzero(flips)
+            block_rows = block[block_rows]
+            now = unpack_rows(packed, block, n)[np.nonzero(flips)]
+            keys = block_rows * n + cols
+            added.append(keys[now])
+            removed.append(keys[~now])
+        return np.concatenate(added), np.concatenate(removed)
+
+    def _update_common(self, previous_edges, previous_common, touched):
+        """
+        维护每条边的共同邻居数：端点都未受影响的边沿用旧值，其余的边按位与后计数。
+        """
+        n = self.num_nodes
+        rows, cols = self.edges // n, self.edges % n
+        common = np.zeros(len(self.edges), dtype=np.int64)
+        stale = touched[rows] | touched[cols]
+        kept = np.flatnonzero(~stale)
+        common[kept] = previous_common[np.searchsorted(previous_edges, self.edges[kept])]
+        stale = np.flatnonzero(stale)
+        for start in range(0, len(stale), self.block_size):
+            chunk = stale[start:start + self.block_size]
+            both = self.packed[rows[chunk]] & self.packed[cols[chunk]]
+            common[chunk] = _popcount(both).sum(axis=1, dtype=np.int64)
+        self.common = common
+
+    def _split_labels(self):
+        """
+        连通分量分裂后，同一标签可能留在互不相连的分量里；按 (分量, 标签) 重新编号，
+        新标签取该组中编号最小的节点，使每个社区都在一个连通分量之内。
+        """
+        n = self.num_nodes
+        groups, inverse = np.unique(self.components.find() * n + self.labels, return_inverse=True)
+        representative = np.full(len(groups), n)
+        np.minimum.at(representative, inverse, np.arange(n))
+        self.labels = representative[inverse]
+
+    def _update_communities(self, touched):
+        """
+        社区划分：以前一天的标签为初值做一次 Louvain（热启动），再从单点社区重新做一次 Louvain，
+        保留模块度较高的结果。只从前一天的标签出发时，网络变稠密后社区会合并成一个而无法再拆开
+        （标签传播正是这样退化的），重新计算的结果保证模块度不低于普通 Louvain。没有边变化时沿用前一天的标签。
+        """
+        n = self.num_nodes
+        isolated = self.degree == 0
+        self.labels[isolated] = np.flatnonzero(isolated)
+        if not touched.any() or not len(self.edges):
+            return
+        rows, cols = self.edges // n, self.edges % n
+        source, target = np.concatenate((rows, cols)), np.concatenate((cols, rows))  # 每条边两个方向
+        weight = np.ones(len(source))
+        best, best_quality = None, -np.inf
+        for initial in (self.labels, np.arange(n)):
+            labels = louvain(source, target, weight, n, initial, self.rng, self.label_rounds)
+            quality = modularity(source, target, weight, labels)
+            if quality > best_quality + 1e-12:
+                best, best_quality = labels, quality
+        best[isolated] = np.flatnonzero(isolated)
+        self.labels = _representatives(best)
+
+    def _metrics(self, added, removed):
+        n = self.num_nodes
+        degree = self.degree
+        num_edges = len(self.edges)
+        in_network = degree > 0
+        triangles_per_node = np.bincount(np.concatenate((self.edges // n, self.edges % n)),
+                                         weights=np.concatenate((self.common, self.common)), minlength=n) / 2
+        wedges = degree * (degree - 1) / 2
+        clustering = np.divide(triangles_per_node, wedges, out=np.zeros(n), where=wedges > 0)
+
+        roots = self.components.find()
+        component_sizes = np.bincount(roots[in_network], minlength=n)
+        community_sizes = np.bincount(self.labels[in_network], minlength=n)
+        modularity = 0.0
+        if num_edges:
+            rows, cols = self.edges // n, self.edges % n
+            internal = np.bincount(self.labels[rows][self.labels[rows] == self.labels[cols]], minlength=n)
+            total_degree = np.bincount(self.labels, weights=degree, minlength=n)
+            modularity = float(np.sum(internal / num_edges - (total_degree / (2 * num_edges)) ** 2))
+        return {
+            'edges': num_edges,
+            'added': added,
+            'removed': removed,
+            'density': 2 * num_edges / (n * (n - 1)) if n > 1 else 0.0,
+            'components': int(np.count_nonzero(component_sizes)),  # 不计孤立节点
+            'largest_component': int(component_sizes.max(initial=0)),
+            'triangles': int(self.common.sum() // 3),
+            'transitivity': float(3 * (self.common.sum() // 3) / wedges.sum()) if wedges.sum() else 0.0,
+            'average_clustering': float(clustering.mean()) if n else 0.0,
+            'communities': int(np.count_nonzero(community_sizes)),
+            'largest_community': int(community_sizes.max(initial=0)),
+            'modularity': modularity,
+        }
+
+    def time_series(self, metric):
+        """
+        返回某个指标的时间序列。
+        :param metric: METRICS 中的指标名，例如 'triangles'
+        :return: (天数列表, 数组)
+        """
+        days = [day for day, _ in self.history]
+        return days, np.array([metrics[metric] for _, metrics in self.history])
+
+
+if __name__ == '__main__':  # 检验代码：与 networkx 逐日重建的结果对比
+    import networkx as nx
+
+    from freshman import BaseFreshman
+    from relationship import StructureRelationship
+
+    relationships = StructureRelationship(BaseFreshman(150, seed=0).get_students(), update_mode='batch', seed=0)
+    stream = NetworkStream(threshold=5)
+    for day in range(25):
+        relationships._step(day)
+        matrix = relationships.relationship_matrix
+        metrics = stream.update(matrix, day + 1)
+        G = nx.from_numpy_array((matrix > 5).astype(int) * (1 - np.eye(len(matrix), dtype=int)))
+        assert metrics['edges'] == G.number_of_edges()
+        assert metrics['triangles'] == sum(nx.triangles(G).values()) // 3
+        assert np.isclose(metrics['transitivity'], nx.transitivity(G))
+        assert np.isclose(metrics['average_clustering'], nx.average_clustering(G))
+        giant = max((len(c) for c in nx.connected_components(G) if len(c) > 1), default=0)
+        assert metrics['largest_component'] == giant
+        assert metrics['components'] == sum(1 for c in nx.connected_components(G) if len(c) > 1)
+        communities = {}
+        for node in G:
+            if G.degree(node):
+                communities.setdefault(stream.labels[node], set()).add(node)
+        assert np.isclose(metrics['modularity'], nx.community.modularity(G.subgraph(
+            [node for node in G if G.degree(node)]), communities.values()) if G.number_of_edges() else 0.0)
+        if G.number_of_edges():  # 社区划分的质量与 networkx 的 Louvain 相当（网络变稠密后也不退化为一个社区）
+            reference = nx.community.modularity(G, nx.community.louvain_communities(G, seed=0))
+            assert metrics['modularity'] >= reference - 0.03, (day, metrics['modularity'], reference)
+    print({name: round(value, 3) for name, value in metrics.items()})
+    print('流式指标与 networkx 逐日重建的结果一致')
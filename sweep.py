@@ -0,0 +1,196 @@
+"""此目的在于对模型参数（k、阈值、天数、人数、寝室人数）做网格扫描，并缓存已完成的结果"""
+from concurrent.futures import as_completed
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+
+from ensemble import CENTRALITY_COLUMNS, EXECUTORS, centrality_array, simulate_replica
+from network import convert_to_adjacency_matrix
+
+# 只影响模拟本身的参数；threshold 只影响后处理，因此同一次模拟可服务多个阈值
+SIMULATION_PARAMETERS = ('model', 'k', 'days', 'num_students', 'dorm_size')
+DEFAULTS = {'model': 'structure', 'k': 0.0015, 'threshold': 5, 'days': 30, 'num_students': 30, 'dorm_size': 4}
+
+
+def parameter_grid(**axes):
+    """
+    由各参数的取值列表生成完整网格，未给出的参数使用 DEFAULTS。
+
+    示例：parameter_grid(k=[0.001, 0.0015, 0.002], threshold=[3, 5])
+    :return: 参数字典列表
+    """
+    unknown = set(axes) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的扫描参数：{sorted(unknown)}")
+    names = list(DEFAULTS)
+    values = [list(axes.get(name, [DEFAULTS[name]])) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def native_value(value):
+    """
+    将参数值转换为 Python 原生类型（NumPy 标量用 .item()），使 np.int64(1000) 与 1000 得到相同的缓存键；
+    字典、列表与元组逐项转换，无法确定如何序列化的类型抛出 TypeError。
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): native_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [native_value(item) for item in value]
+    raise TypeError(f"无法用作扫描参数或种子的类型：{type(value).__name__}")
+
+
+def cache_key(params, seed):
+    """
+    参数与种子的哈希，用作缓存文件名。参数按名称排序后序列化，与传入顺序无关；
+    NumPy 标量先转换为原生类型（见 native_value），因此用 np.arange 等生成的网格也能命中缓存。
+
+    :param params: 参数字典
+    :param seed: 随机数种子（整数）
+    :return: 十六进制字符串
+    """
+    payload = json.dumps({'params': native_value(params), 'seed': native_value(seed)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    以 .npz 文件保存结果的目录缓存；写入先落到临时文件再原子替换，
+    因此并发写入或中途被杀死都不会留下损坏的缓存项。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        """
+        读取缓存项，返回 {名称: 数组}。
+        """
+        with np.load(self.path(key), allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    def save(self, key, **arrays):
+        """
+        写入缓存项。
+        """
+        temporary = self.path(key) + f'.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temporary, self.path(key))
+
+
+def _simulation_params(params):
+    return {name: params[name] for name in SIMULATION_PARAMETERS}
+
+
+def run_simulation_group(simulation_params, thresholds, seed, cache_dir):
+    """
+    完成一组共享同一次模拟的网格单元：模拟结果与每个阈值下的中心性分别缓存，
+    已存在的缓存项直接跳过。
+
+    :param simulation_params: SIMULATION_PARAMETERS 对应的参数字典
+    :param thresholds: 需要计算的阈值列表
+    :param seed: 随机数种子
+    :param cache_dir: 缓存目录
+    :return: [(完整参数字典, 单元缓存键)]
+    """
+    cache = ResultCache(cache_dir)
+    simulation_key = cache_key(simulation_params, seed)
+    matrix = None
+    cells = []
+    for threshold in thresholds:
+        params = dict(simulation_params, threshold=threshold)
+        key = cache_key(params, seed)
+        cells.append((params, key))
+        if key in cache:
+            continue
+        if matrix is None:
+            if simulation_key in cache:
+                matrix = cache.load(simulation_key)['matrix']
+            else:
+                relationship_options = {}
+                if simulation_params['model'] == 'structure':
+                    relationship_options['k'] = simulation_params['k']
+                matrix = simulate_replica(simulation_params['model'], simulation_params['num_students'],
+                                          simulation_params['days'], np.random.SeedSequence(seed),
+                                          relationship_options, {'dorm_size': simulation_params['dorm_size']})
+                if not isinstance(matrix, np.ndarray):
+                    matrix = matrix.toarray()
+                cache.save(simulation_key, matrix=matrix)
+        adjacency_matrix = convert_to_adjacency_matrix(matrix, threshold=threshold)
+        cache.save(key, centrality=centrality_array(adjacency_matrix), simulation_key=np.array(simulation_key))
+    return cells
+
+
+def run_sweep(grid, seed=42, cache_dir='./output/SweepOutput/cache', workers=None, executor='process'):
+    """
+    在进程池上执行参数网格。网格单元按“模拟参数”分组，同组只模拟一次；
+    已缓存的单元不会重新计算，因此扩展网格后重跑只计算新增部分。
+
+    :param grid: parameter_grid 的返回值（或同结构的字典列表）
+    :param seed: 随机数种子，所有单元使用相同种子（公共随机数，便于比较参数效应）
+    :param cache_dir: 缓存目录
+    :param workers: 进程数，默认 CPU 核数；0 表示在当前进程内串行运行
+    :param executor: 并行方式，'process'（默认）或 'thread'；每组的随机数流只由 seed 决定，
+                     串行、多线程与多进程的结果逐位相同
+    :return: 结果汇总表（pandas.DataFrame），每行一个网格单元
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor 必须是 {tuple(EXECUTORS)} 之一，收到 {executor!r}")
+    seed = native_value(seed)
+    groups = {}  # 模拟缓存键 -> (模拟参数, 阈值列表)
+    for params in grid:
+        params = native_value(dict(DEFAULTS, **params))
+        simulation_params = _simulation_params(params)
+        group = groups.setdefault(cache_key(simulation_params, seed), (simulation_params, []))
+        if params['threshold'] not in group[1]:
+            group[1].append(params['threshold'])
+
+    cells = []
+    if workers == 0:
+        for simulation_params, thresholds in groups.values():
+            cells.extend(run_simulation_group(simulation_params, thresholds, seed, cache_dir))
+    else:
+        with EXECUTORS[executor](max_workers=workers) as pool:
+            futures = [pool.submit(run_simulation_group, simulation_params, thresholds, seed, cache_dir)
+                       for simulation_params, thresholds in groups.values()]
+            for future in as_completed(futures):
+                cells.extend(future.result())
+    return summarize_sweep(cells, cache_dir)
+
+
+def summarize_sweep(cells, cache_dir):
+    """
+    从缓存读取各单元的中心性，汇总为每个单元一行的 DataFrame（参数 + 各中心性均值 + 缓存键）。
+    """
+    import pandas as pd
+
+    cache = ResultCache(cache_dir)
+    rows = []
+    for params, key in cells:
+        centrality = cache.load(key)['centrality']
+        row = dict(params)
+        row.update({f'mean_{column}': centrality[:, index].mean() for index, column in enumerate(CENTRALITY_COLUMNS)})
+        row['key'] = key
+        rows.append(row)
+    if not rows:  # 空网格：返回列齐全的空表
+        columns = list(DEFAULTS) + [f'mean_{column}' for column in CENTRALITY_COLUMNS] + ['key']
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(rows).sort_values(list(DEFAULTS)).reset_index(drop=True)
+
+
+if __name__ == '__main__':  # 检验代码：复现 k=0.001、0.0015、0.002 三组结构模型
+    print(run_sweep(parameter_grid(k=[0.001, 0.0015, 0.002], threshold=[3, 5])))
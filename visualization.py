@@ -1,96 +1,149 @@
 # 此文档的目的在于进行可视化
+from contextlib import contextmanager
+import os
+import sys
+
+import matplotlib
+
+# 无图形界面（或设置了 SNS_HEADLESS）时使用 Agg 后端，批量出图不依赖显示环境
+if os.environ.get('SNS_HEADLESS') or (sys.platform.startswith('linux') and not os.environ.get('DISPLAY')):
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 import numpy as np
 import networkx as nx
 import matplotlib.colors as mcolors
 import matplotlib.patches as patches
-import matplotlib.font_manager as fm
+from matplotlib.collections import PatchCollection
+
+from network import _is_sparse, as_analysis
 
 # 设置全局字体
 plt.rcParams['font.sans-serif'] = ['SimHei']  # 中文字体
 plt.rcParams['axes.unicode_minus'] = False  # 防止负号显示问题
 
+# 稀疏关系矩阵转为稠密后出图的最大学生数（10000² 个 float64 约 800 MB）
+MAX_DENSE_STUDENTS = 10000
+
+
+def use_headless():
+    """
+    切换到无界面的 Agg 后端（只保存图片，不弹出窗口）。
+    """
+    plt.switch_backend('Agg')
+
+
+@contextmanager
+def new_figure(path, figsize, tight_layout=False):
+    """
+    创建图形，with 块正常结束后保存到 path；无论成功与否都会关闭图形，
+    避免多次出图（或出错）时图形对象在内存中累积。
+
+    :param path: 图片保存路径
+    :param figsize: 图形尺寸
+    :param tight_layout: 保存前是否调用 tight_layout
+    :return: (fig, ax)
+    """
+    fig, ax = plt.subplots(figsize=figsize)
+    try:
+        yield fig, ax
+        if tight_layout:
+            fig.tight_layout()
+        fig.savefig(path)
+    finally:
+        plt.close(fig)
+
+
+def as_dense_matrix(matrix, max_students=MAX_DENSE_STUDENTS):
+    """
+    出图前把关系矩阵转为稠密数组：scipy.sparse 矩阵（如 storage='sparse' 的模拟结果）在学生数不超过
+    max_students 时转为稠密，超过时抛出 ValueError，而不是为一张图分配 n² 的内存。
+
+    :param matrix: 稠密数组、列表或 scipy.sparse 矩阵
+    :param max_students: 允许转为稠密的最大学生数
+    :return: numpy 数组
+    """
+    if _is_sparse(matrix):
+        if matrix.shape[0] > max_students:
+            raise ValueError(f"稀疏关系矩阵有 {matrix.shape[0]} 名学生，超过出图上限 {max_students}，"
+                             f"转为稠密需要约 {matrix.shape[0] ** 2 * 8 / 2 ** 30:.1f} GB；请关闭 heatmap、distribution 产出")
+        return matrix.toarray()
+    return np.asarray(matrix)
+
+
 def plot_heatmap(matrix, save_path, vmin=-20, vmax=20, title="社会关系热力图"):
     """
     绘制热力图矩阵。
 
-    :param matrix: 输入的二维数组或矩阵
+    :param matrix: 输入的二维数组或矩阵（scipy.sparse 矩阵按 as_dense_matrix 转为稠密）
     :param vmin: 热力图的最小值（默认 -20）
     :param vmax: 热力图的最大值（默认 20）
     :param title: 热力图标题（可选）
     """
+    matrix = as_dense_matrix(matrix)
     # 创建一个新的绘图窗口
-    plt.figure(figsize=(8, 8))
-
-    # 绘制热力图
-    plt.imshow(matrix, cmap="coolwarm", vmin=vmin, vmax=vmax)
-    plt.colorbar(label="关系强度")  # 添加颜色条
-
-    # 添加标题
-    plt.title(title, fontsize=16)
+    with new_figure(f'{save_path}/社会关系热力图.png', figsize=(8, 8)) as (fig, ax):
+        # 绘制热力图
+        image = ax.imshow(matrix, cmap="coolwarm", vmin=vmin, vmax=vmax)
+        fig.colorbar(image, ax=ax, label="关系强度")  # 添加颜色条
 
-    # 添加 x 和 y 轴的标签
-    plt.xlabel("学生标签", fontsize=12)
-    plt.ylabel("学生标签", fontsize=12)
+        # 添加标题
+        ax.set_title(title, fontsize=16)
 
-    # 显示网格线
-    plt.grid(False)
+        # 添加 x 和 y 轴的标签
+        ax.set_xlabel("学生标签", fontsize=12)
+        ax.set_ylabel("学生标签", fontsize=12)
 
-    # 显示与存储图形
-    plt.savefig(f'{save_path}/社会关系热力图.png')
-    # plt.show()
+        # 显示网格线
+        ax.grid(False)
 
 
-def visualize_matrix_distribution(matrix, save_path):
+def visualize_matrix_distribution(matrix, save_path, bins=20):
     """
-    绘制每个人的关系分布图（直方图）
+    绘制每个人的关系分布图：每行一个学生、每列一个取值区间的二维直方图（密度图），
+    一次向量化统计所有学生，代替逐个学生调用 plt.hist。
 
-    :param matrix: 输入的二维矩阵 (numpy 数组或列表)
+    :param matrix: 输入的二维矩阵 (numpy 数组、列表，或按 as_dense_matrix 转为稠密的 scipy.sparse 矩阵)
     :param save_path: 保存图片的路径
+    :param bins: 取值区间数
     """
-    # 创建图形
-    plt.figure(figsize=(10, 6))
+    matrix = np.asarray(as_dense_matrix(matrix), dtype=float)
     num_students = len(matrix)  # 学生数量
 
-    # 为每个学生的关系绘制直方图
-    for i, row in enumerate(matrix):
-        plt.hist(row, bins=20, alpha=0.6, label=f"学生 {i + 1}", density=True)
-
-    # 添加标题和标签
-    plt.title("个人关系分布图", fontsize=16)
-    plt.xlabel("关系量化值", fontsize=12)
-    plt.ylabel("频率", fontsize=12)
+    # 所有学生共用同一组区间，逐行统计频率（与 density=True 一致，每行积分为 1）
+    edges = np.linspace(matrix.min(), matrix.max() if matrix.max() > matrix.min() else matrix.min() + 1, bins + 1)
+    index = np.clip(np.searchsorted(edges, matrix, side='right') - 1, 0, bins - 1)
+    counts = np.bincount((np.arange(num_students)[:, None] * bins + index).ravel(),
+                         minlength=num_students * bins).reshape(num_students, bins)
+    density = counts / (matrix.shape[1] * np.diff(edges))
 
-    # 显示图例
-    plt.grid(alpha=0.3)
+    # 创建图形
+    with new_figure(f'{save_path}/个人关系分布图.png', figsize=(10, 6), tight_layout=True) as (fig, ax):
+        image = ax.imshow(density, aspect='auto', cmap='viridis', interpolation='nearest',
+                          extent=(edges[0], edges[-1], num_students + 0.5, 0.5))
+        fig.colorbar(image, ax=ax, label="频率")
 
-    # 保存并显示图像
-    plt.tight_layout()
-    plt.savefig(f'{save_path}/个人关系分布图.png')
-    # plt.show()
+        # 添加标题和标签
+        ax.set_title("个人关系分布图", fontsize=16)
+        ax.set_xlabel("关系量化值", fontsize=12)
+        ax.set_ylabel("学生标签", fontsize=12)
 
 
 def visualize_social_network(adj_matrix, save_path):
     """
     根据邻接矩阵绘制社会网络图，节点颜色根据度数变化。
 
-    :param adj_matrix: 邻接矩阵，二维 NumPy 数组
+    :param adj_matrix: 邻接矩阵（二维 NumPy 数组）或 network.NetworkAnalysis
     :param save_path: 保存图形的路径
     """
-    # 创建一个空图
-    G = nx.Graph()
-
-    # 将邻接矩阵添加到图中
-    num_nodes = len(adj_matrix)
-    for i in range(num_nodes):
-        for j in range(i + 1, num_nodes):  # 避免重复边
-            if adj_matrix[i][j] == 1:  # 如果有连接
-                G.add_edge(i, j)
+    # 复用同一次运行的图（只构建一次）
+    analysis = as_analysis(adj_matrix)
+    G = analysis.graph
 
     # 计算每个节点的度（即每个人的连接数）
     degrees = dict(G.degree())
-    max_degree = max(degrees.values())
-    min_degree = min(degrees.values())
+    max_degree = max(degrees.values(), default=1)  # 没有连边时图为空，仍输出带颜色条的空白图
+    min_degree = min(degrees.values(), default=0)
 
     # 定义颜色渐变
     colors = ['#25d938', '#00a1d4']  # 从绿色到蓝色
@@ -101,90 +154,65 @@ def visualize_social_network(adj_matrix, save_path):
     node_colors = [cmap(norm(degrees[node])) for node in G.nodes()]
 
     # 绘制图形
-    fig, ax = plt.subplots(figsize=(12, 12))
-    pos = nx.spring_layout(G, seed=42)  # 使用 spring 布局
-    nx.draw(G, pos, with_labels=True, node_size=3000, node_color=node_colors, font_size=12, font_weight='bold', edge_color='gray')
+    with new_figure(f'{save_path}/社会网络图.png', figsize=(12, 12), tight_layout=True) as (fig, ax):
+        pos = analysis.pos  # 使用 spring 布局（每次运行只计算一次）
+        nx.draw(G, pos, with_labels=True, node_size=3000, node_color=node_colors, font_size=12, font_weight='bold', edge_color='gray')
 
-    # 添加颜色条
-    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    cbar = fig.colorbar(sm, ax=ax, orientation='vertical', label='Degree')
-
-    # 保存和显示图形
-    plt.tight_layout()
-    plt.savefig(f'{save_path}/社会网络图.png')
-    # plt.show()
+        # 添加颜色条
+        sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
+        sm.set_array([])
+        cbar = fig.colorbar(sm, ax=ax, orientation='vertical', label='Degree')
 
 def visualize_social_network_attribute(adj_matrix, attribute, save_path):
     """
     根据邻接矩阵绘制社会网络图，节点颜色根据 dormitory 属性变化，节点名称为 interest。
 
-    :param adj_matrix: 邻接矩阵，二维 NumPy 数组
+    :param adj_matrix: 邻接矩阵（二维 NumPy 数组）或 network.NetworkAnalysis
     :param attribute: 学生属性列表，与邻接矩阵的顺序一致，每个属性是一个字典
                       示例：{'student_number': 1, 'dormitory': 2, 'interest': '网游'}
     :param save_path: 保存图形的路径
     """
-    # 创建一个空图
-    G = nx.Graph()
-
-    # 将邻接矩阵添加到图中
-    num_nodes = len(adj_matrix)
-    for i in range(num_nodes):
-        for j in range(i + 1, num_nodes):  # 避免重复边
-            if adj_matrix[i][j] == 1:  # 如果有连接
-                G.add_edge(i, j)
+    # 复用同一次运行的图（只构建一次）
+    analysis = as_analysis(adj_matrix)
+    G = analysis.graph
 
     # 提取 dormitory 属性并为每个节点定义颜色
     dormitory_colors = {attr['dormitory'] for attr in attribute}  # 提取所有不同的 dormitory 值
     color_map = {dorm: plt.cm.tab10(idx) for idx, dorm in enumerate(dormitory_colors)}  # 生成颜色映射
-    node_colors = [color_map[attr['dormitory']] for attr in attribute]  # 根据 dormitory 赋予颜色
+    # 根据 dormitory 赋予颜色；颜色与标签按图中节点的顺序给出（没有连边的学生不在图中）
+    node_colors = [color_map[attribute[node]['dormitory']] for node in G.nodes()]
 
     # 提取 interest 属性作为节点标签
-    node_labels = {i: attr['interest'] for i, attr in enumerate(attribute)}
+    node_labels = {node: attribute[node]['interest'] for node in G.nodes()}
 
     # 绘制图形
-    fig, ax = plt.subplots(figsize=(12, 12))
-    pos = nx.spring_layout(G, seed=42)  # 使用 spring 布局
-    nx.draw_networkx_edges(G, pos, edge_color='gray', alpha=0.5)  # 绘制边
-    nx.draw_networkx_nodes(
-        G, pos, node_size=3000, node_color=node_colors, edgecolors='black', cmap=plt.cm.tab10
-    )  # 绘制节点
-    nx.draw_networkx_labels(G, pos, labels=node_labels, font_size=10, font_weight='bold')  # 添加标签
-
-    # 添加图例
-    legend_elements = [
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=color, markersize=10, label=f"Dormitory {dorm}")
-        for dorm, color in color_map.items()
-    ]
-    ax.legend(handles=legend_elements, loc='upper right', title="Dormitory")
-
-    # 保存和显示图形
-    plt.tight_layout()
-    plt.savefig(f'{save_path}/社会网络图_属性.png')
-    # plt.show()
+    with new_figure(f'{save_path}/社会网络图_属性.png', figsize=(12, 12), tight_layout=True) as (fig, ax):
+        pos = analysis.pos  # 使用 spring 布局（每次运行只计算一次）
+        nx.draw_networkx_edges(G, pos, edge_color='gray', alpha=0.5)  # 绘制边
+        nx.draw_networkx_nodes(
+            G, pos, node_size=3000, node_color=node_colors, edgecolors='black', cmap=plt.cm.tab10
+        )  # 绘制节点
+        nx.draw_networkx_labels(G, pos, labels=node_labels, font_size=10, font_weight='bold')  # 添加标签
+
+        # 添加图例
+        legend_elements = [
+            plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=color, markersize=10, label=f"Dormitory {dorm}")
+            for dorm, color in color_map.items()
+        ]
+        ax.legend(handles=legend_elements, loc='upper right', title="Dormitory")
 
 
 def visualize_network_with_centrality(adj_matrix, save_path):
     """
     可视化基于邻接矩阵的社会网络，并为每个节点绘制多种中心性指标的颜色。
 
-    :param adj_matrix: 邻接矩阵（NumPy 数组或二维列表）
+    :param adj_matrix: 邻接矩阵（NumPy 数组或二维列表）或 network.NetworkAnalysis
     """
-    # 创建图
-    G = nx.Graph()
-    num_nodes = len(adj_matrix)
-
-    # 将邻接矩阵添加到图中
-    for i in range(num_nodes):
-        for j in range(i + 1, num_nodes):  # 避免重复边
-            if adj_matrix[i][j] == 1:  # 如果有连接
-                G.add_edge(i, j)
-
-    # 计算各类中心性
-    degree_centrality = nx.degree_centrality(G)
-    betweenness_centrality = nx.betweenness_centrality(G)
-    closeness_centrality = nx.closeness_centrality(G)
-    eigenvector_centrality = nx.eigenvector_centrality(G, max_iter=1000)
+    # 复用同一次运行的图与中心性
+    analysis = as_analysis(adj_matrix)
+    G = analysis.graph
+    degree_centrality, betweenness_centrality, closeness_centrality, eigenvector_centrality = \
+        analysis.centrality_values
 
     # 提取每种中心性最高的5个节点
     top_5_degree = set(sorted(degree_centrality, key=degree_centrality.get, reverse=True)[:5])
@@ -218,41 +246,42 @@ def visualize_network_with_centrality(adj_matrix, save_path):
             return ['gray']
 
     # 绘制图形
-    fig, ax = plt.subplots(figsize=(16, 16))
-    pos = nx.spring_layout(G, seed=42)  # 布局算法
-
-    # 绘制网络边
-    nx.draw_networkx_edges(G, pos, alpha=0.5, edge_color='gray')
-
-    # 绘制节点
-    for node, (x, y) in pos.items():
-        segments = get_node_color(node)
-        if len(segments) > 1:
-            # 计算角度
-            num_segments = len(segments)
-            angles = np.linspace(0, 2 * np.pi, num_segments + 1)
-            wedge_radius = 0.06  # 调整饼图的大小
-            for i in range(num_segments):
-                wedge = patches.Wedge(center=(x, y), r=wedge_radius, theta1=np.degrees(angles[i]),
-                                      theta2=np.degrees(angles[i + 1]), color=segments[i], ec='black')
-                ax.add_patch(wedge)
-        else:
-            nx.draw_networkx_nodes(G, pos, nodelist=[node], node_color=segments[0], node_size=3000)
-
-    # 绘制节点标签
-    nx.draw_networkx_labels(G, pos, font_size=10, font_weight='bold')
-
-    # 添加图例
-    from matplotlib.lines import Line2D
-    legend_elements = [
-        Line2D([0], [0], marker='o', color='w', label='Degree Centrality', markersize=10, markerfacecolor='red'),
-        Line2D([0], [0], marker='o', color='w', label='Betweenness Centrality', markersize=10, markerfacecolor='blue'),
-        Line2D([0], [0], marker='o', color='w', label='Closeness Centrality', markersize=10, markerfacecolor='yellow'),
-        Line2D([0], [0], marker='o', color='w', label='Eigenvector Centrality', markersize=10, markerfacecolor='green'),
-        Line2D([0], [0], marker='o', color='w', label='Other Nodes', markersize=10, markerfacecolor='gray'),
-    ]
-    ax.legend(handles=legend_elements, loc='upper right')
-
-    # 显示并保存图片
-    plt.savefig(f'{save_path}/社会网络图_中心性分析.png')
-    # plt.show()
\ No newline at end of file
+    with new_figure(f'{save_path}/社会网络图_中心性分析.png', figsize=(16, 16)) as (fig, ax):
+        pos = analysis.pos  # 布局算法（每次运行只计算一次）
+
+        # 绘制网络边
+        nx.draw_networkx_edges(G, pos, alpha=0.5, edge_color='gray')
+
+        # 绘制节点：单色节点一次 scatter；多指标节点的饼图扇形汇总为一个 PatchCollection
+        single_nodes, single_colors = [], []
+        wedges, wedge_colors = [], []
+        wedge_radius = 0.06  # 调整饼图的大小
+        for node, (x, y) in pos.items():
+            segments = get_node_color(node)
+            if len(segments) > 1:
+                # 计算角度
+                angles = np.degrees(np.linspace(0, 2 * np.pi, len(segments) + 1))
+                for i, color in enumerate(segments):
+                    wedges.append(patches.Wedge(center=(x, y), r=wedge_radius, theta1=angles[i], theta2=angles[i + 1]))
+                    wedge_colors.append(color)
+            else:
+                single_nodes.append(node)
+                single_colors.append(segments[0])
+        if single_nodes:
+            nx.draw_networkx_nodes(G, pos, nodelist=single_nodes, node_color=single_colors, node_size=3000, ax=ax)
+        if wedges:
+            ax.add_collection(PatchCollection(wedges, facecolors=wedge_colors, edgecolors='black'))
+
+        # 绘制节点标签
+        nx.draw_networkx_labels(G, pos, font_size=10, font_weight='bold')
+
+        # 添加图例
+        from matplotlib.lines import Line2D
+        legend_elements = [
+            Line2D([0], [0], marker='o', color='w', label='Degree Centrality', markersize=10, markerfacecolor='red'),
+            Line2D([0], [0], marker='o', color='w', label='Betweenness Centrality', markersize=10, markerfacecolor='blue'),
+            Line2D([0], [0], marker='o', color='w', label='Closeness Centrality', markersize=10, markerfacecolor='yellow'),
+            Line2D([0], [0], marker='o', color='w', label='Eigenvector Centrality', markersize=10, markerfacecolor='green'),
+            Line2D([0], [0], marker='o', color='w', label='Other Nodes', markersize=10, markerfacecolor='gray'),
+        ]
+        ax.legend(handles=legend_elements, loc='upper right')
\ No newline at end of file